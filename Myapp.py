@@ -1,20 +1,32 @@
-from flask import Blueprint, Flask, request, jsonify, render_template, redirect, url_for, flash, send_file, session
+from flask import Blueprint, Flask, request, jsonify, render_template, redirect, url_for, flash, send_file, session, Response, stream_with_context
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from firebase_config import FirebaseDB, MockDB
+from sales_analytics import SalesColumns
+from image_store import ImageStore
 from datetime import datetime, timezone, timedelta
 import base64
+import bisect
 import os
 import logging
 from io import BytesIO
 import uuid
 from firebase_admin import credentials, firestore, initialize_app
+from google.cloud.firestore_v1.field_path import FieldPath
 import json
 from urllib.parse import unquote
 from functools import wraps
 import re
 import calendar
+import codecs
+import csv
+import hashlib
+import heapq
+import threading
+import time
+import click
+from concurrent.futures import ThreadPoolExecutor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -34,6 +46,10 @@ app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HT
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
+# Uploaded images (customer profile pictures) are kept on the local filesystem
+app.config['IMAGE_STORE_PATH'] = os.environ.get('IMAGE_STORE_PATH', os.path.join(app.root_path, 'media', 'images'))
+image_store = ImageStore(app.config['IMAGE_STORE_PATH'])
+
 # Initialize Firebase
 use_firebase = False
 db = None
@@ -58,32 +74,93 @@ def create_mock_db():
     class MockDB:
         def collection(self, name):
             return MockCollection()
+        def get_all(self, references, field_paths=None):
+            return []
+        def batch(self):
+            return MockBatch()
+        def transaction(self):
+            return MockTransaction()
+    
+    # Enough of a Transaction for @firestore.transactional: one attempt, writes applied directly
+    class MockTransaction:
+        _read_only = False
+        _max_attempts = 1
+        _id = None
+        commit_time = None
+        def _clean_up(self):
+            return None
+        def _begin(self, retry_id=None):
+            return None
+        def _commit(self):
+            return []
+        def _rollback(self):
+            return None
+        def get_all(self, references):
+            return []
+        def create(self, reference, data):
+            return reference.set(data)
+        def set(self, reference, data, merge=False):
+            return reference.set(data, merge=merge)
+        def update(self, reference, data):
+            return reference.update(data)
+        def delete(self, reference):
+            return reference.delete()
+    
+    class MockBatch:
+        commit_time = None
+        def set(self, reference, data, merge=False):
+            return None
+        def create(self, reference, data):
+            return None
+        def update(self, reference, data):
+            return None
+        def delete(self, reference):
+            return None
+        def commit(self):
+            return []
     
     class MockCollection:
         def stream(self):
             return []
-        def document(self, doc_id):
+        def document(self, doc_id=None):
             return MockDocument()
         def add(self, data):
             return (None, MockDocument())
         def where(self, field, op, value):
             return self
+        def order_by(self, field, direction=None):
+            return self
+        def offset(self, num):
+            return self
+        def start_after(self, values):
+            return self
+        def limit(self, count):
+            return self
+        def select(self, fields):
+            return self
+        def count(self, alias=None):
+            return MockAggregation()
     
-    class MockDocument:
+    class MockAggregation:
+        def sum(self, field, alias=None):
+            return self
         def get(self):
+            return []
+    
+    class MockDocument:
+        def get(self, field_paths=None, transaction=None):
             return MockDocSnapshot()
         def update(self, data):
             return None
         def delete(self):
             return None
-        def set(self, data):
+        def set(self, data, merge=False):
             return None
-        def id(self):
-            return "mock_id"
+        id = "mock_id"
     
     class MockDocSnapshot:
-        def exists(self):
-            return False
+        exists = False
+        id = "mock_id"
         def to_dict(self):
             return {}
     
@@ -373,6 +450,103 @@ def staff_dashboard_legacy():
     """Legacy staff dashboard route - redirects to new dashboard."""
     return redirect(url_for('dashboard'))
 
+# Staff name resolution
+STAFF_DIRECTORY_TTL = 300  # seconds
+
+class StaffDirectory:
+    """Process-wide cache of staff display names keyed by user id.
+    
+    Entries expire after ``ttl`` seconds and are dropped whenever an account
+    is changed. Misses are fetched in one batched read covering only the ids
+    that were asked for, never the whole users collection.
+    """
+    
+    def __init__(self, ttl=STAFF_DIRECTORY_TTL):
+        self.ttl = ttl
+        self._names = {}
+        self._lock = threading.Lock()
+    
+    def resolve(self, staff_ids):
+        """Return a {staff_id: display name} map for the given ids."""
+        now = time.monotonic()
+        names = {}
+        missing = []
+        with self._lock:
+            for staff_id in set(staff_ids):
+                if not staff_id:
+                    continue
+                entry = self._names.get(staff_id)
+                if entry and entry[1] > now:
+                    names[staff_id] = entry[0]
+                else:
+                    missing.append(staff_id)
+        
+        if missing:
+            fetched = {}
+            try:
+                users_ref = db.collection('users')
+                refs = [users_ref.document(staff_id) for staff_id in missing]
+                for user_doc in db.get_all(refs, field_paths=['name', 'username']):
+                    if user_doc.exists:
+                        user = user_doc.to_dict()
+                        fetched[user_doc.id] = user.get('name', user.get('username', 'Unknown'))
+            except Exception as e:
+                logger.warning(f"Error loading users for sales mapping: {e}")
+                return {**names, **{staff_id: 'Unknown' for staff_id in missing}}
+            
+            expires_at = now + self.ttl
+            with self._lock:
+                for staff_id in missing:
+                    name = fetched.get(staff_id, 'Unknown')
+                    self._names[staff_id] = (name, expires_at)
+                    names[staff_id] = name
+        return names
+    
+    def invalidate(self, staff_id=None):
+        """Drop one cached name, or all of them when no id is given."""
+        with self._lock:
+            if staff_id is None:
+                self._names.clear()
+            else:
+                self._names.pop(staff_id, None)
+
+staff_directory = StaffDirectory()
+
+def staff_names_for(sales):
+    """Resolve staff names for the staff ids that appear in a list of sales."""
+    return staff_directory.resolve(sale.get('staff_id') for sale in sales)
+
+SALES_STREAM_CHUNK_SIZE = 200
+
+def stream_sales_ndjson(query=None, chunk_size=SALES_STREAM_CHUNK_SIZE):
+    """Yield sales newest first as newline-delimited JSON.
+    
+    Sales are formatted in small chunks as the ordered query delivers them,
+    so memory stays bounded and the first line goes out without waiting for
+    the rest of the history.
+    """
+    if query is None:
+        query = db.collection('sales')
+    ordered = query.order_by(SALE_DATE_FIELD, direction=firestore.Query.DESCENDING)
+    
+    def flush(chunk):
+        users_map = staff_names_for(chunk)
+        return ''.join(app.json.dumps(format_sale_for_display(sale, users_map)) + '\n' for sale in chunk)
+    
+    chunk = []
+    try:
+        for doc in ordered.stream():
+            chunk.append({'id': doc.id, **doc.to_dict()})
+            if len(chunk) >= chunk_size:
+                yield flush(chunk)
+                chunk = []
+        if chunk:
+            yield flush(chunk)
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        logger.error(f"Database error during streaming sales: {e}")
+        yield app.json.dumps({'error': 'Database error during streaming sales'}) + '\n'
+
 # Sales Management Routes
 @app.route('/api/sales', methods=['GET', 'POST'])
 @validate_session
@@ -383,25 +557,41 @@ def sales_api():
             # Get sales history from Firebase
             sales_ref = db.collection('sales')
             sales = []
-            users_map = {}
             
-            # Preload all users for mapping user_id to name
-            try:
-                for user_doc in db.collection('users').stream():
-                    user = user_doc.to_dict()
-                    users_map[user_doc.id] = user.get('name', user.get('username', 'Unknown'))
-            except Exception as e:
-                logger.warning(f"Error loading users for sales mapping: {e}")
+            # Streamed NDJSON for full-history consumers (statistics, exports)
+            if request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson':
+                return Response(stream_with_context(stream_sales_ndjson()), mimetype='application/x-ndjson')
+            
+            # Keyset pagination when a page size or cursor is requested
+            if 'limit' in request.args or 'cursor' in request.args:
+                limit = parse_page_limit(request.args.get('limit'))
+                try:
+                    docs, next_cursor, prev_cursor = keyset_page(sales_ref, SALE_DATE_FIELD, request.args.get('cursor', ''), limit)
+                except ValueError:
+                    return handle_validation_error('Invalid cursor')
+                
+                sales = [{'id': doc.id, **doc.to_dict()} for doc in docs]
+                users_map = staff_names_for(sales)
+                sales = [format_sale_for_display(sale, users_map) for sale in sales]
+                
+                return jsonify({
+                    'success': True,
+                    'sales': sales,
+                    'limit': limit,
+                    'next_cursor': next_cursor,
+                    'prev_cursor': prev_cursor
+                })
             
             # Get all sales and sort by date (most recent first)
-            for doc in sales_ref.stream():
-                sale = {'id': doc.id, **doc.to_dict()}
+            raw_sales = [{'id': doc.id, **doc.to_dict()} for doc in sales_ref.stream()]
+            users_map = staff_names_for(raw_sales)
+            for sale in raw_sales:
                 # Parse date for sorting
-                try:
-                    dt = datetime.fromisoformat(sale.get('date', ''))
+                dt = sale_datetime(sale)
+                if dt:
                     sale['date_parsed'] = dt  # Keep parsed date for sorting
                     sale['date'] = dt.strftime('%B %d, %Y (%I:%M %p)')
-                except (ValueError, TypeError):
+                else:
                     sale['date_parsed'] = datetime.min  # Put invalid dates at the end
                 
                 # Add staff name
@@ -440,16 +630,271 @@ def manage_sale(sale_id):
             if not data:
                 return handle_validation_error('No data provided')
             
-            db.collection('sales').document(sale_id).update(data)
+            # Keep the native date fields in sync with an edited ISO date
+            if 'date' in data:
+                try:
+                    data.update(sale_date_fields(datetime.fromisoformat(data['date'])))
+                except (ValueError, TypeError):
+                    return handle_validation_error('Invalid sale date')
+            
+            sale_ref = db.collection('sales').document(sale_id)
+            result = update_sale_in_transaction(db.transaction(), sale_ref, data)
+            if result is None:
+                return handle_not_found_error('Sale')
+            old_sale, updated_sale = result
+            if 'date' in data or 'customer_name' in data:
+                refresh_purchase_span_in_transaction(db.transaction(), old_sale.get('customer_name', 'Walk-in Customer'))
+            recent_sales.update(sale_id, data)
+            customer_search.apply_sale(old_sale, updated_sale)
+            sales_engine.add(sale_id, updated_sale, sale_datetime(updated_sale))
             return jsonify({'success': True, 'message': 'Sale updated successfully'})
         
         elif request.method == 'DELETE':
-            db.collection('sales').document(sale_id).delete()
+            sale_ref = db.collection('sales').document(sale_id)
+            deleted_sale = delete_sale_in_transaction(db.transaction(), sale_ref)
+            if deleted_sale:
+                refresh_purchase_span_in_transaction(db.transaction(), deleted_sale.get('customer_name', 'Walk-in Customer'))
+                customer_search.apply_sale(old_sale=deleted_sale)
+            recent_sales.remove(sale_id)
+            sales_engine.remove(sale_id)
             return jsonify({'success': True, 'message': 'Sale deleted successfully'})
     
     except Exception as e:
         return handle_database_error(e, "managing sale")
 
+# Sales query planning
+SALES_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+SALE_DATE_FIELD = 'date_ts'
+
+# Inclusive (low, high) bounds for the amountFilter values used by sales.html
+AMOUNT_FILTER_RANGES = {
+    '0-1000': (0, 1000),
+    '1000-5000': (1000, 5000),
+    '5000-10000': (5000, 10000),
+    '10000+': (10000, None)
+}
+
+def sales_date_bounds(date_filter, start_date='', end_date=''):
+    """Translate a dateFilter value into a half-open (start, end) datetime range."""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    if date_filter == 'today':
+        return today, today + timedelta(days=1)
+    if date_filter == 'yesterday':
+        return today - timedelta(days=1), today
+    if date_filter == 'week':
+        return today - timedelta(days=7), None
+    if date_filter == 'month':
+        return today - timedelta(days=30), None
+    if date_filter == 'custom' and start_date and end_date:
+        try:
+            start_dt = datetime.strptime(start_date, '%Y-%m-%d')
+            end_dt = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+            return start_dt, end_dt
+        except ValueError:
+            pass  # Invalid date format, skip filter
+    return None, None
+
+def sale_date_value(dt):
+    """Convert a datetime into the value stored in the sale date field.
+    
+    Naive datetimes are local time, like the ISO ``date`` strings.
+    """
+    return dt.astimezone()
+
+def sale_date_fields(dt):
+    """Native date fields stored next to the ISO ``date`` string of a sale.
+    
+    ``date_ts`` is a Firestore timestamp used for ordering and range filters,
+    ``date_epoch`` holds seconds since the epoch and ``day`` is the local
+    YYYY-MM-DD bucket.
+    """
+    local_dt = dt.astimezone()
+    return {
+        'date_ts': local_dt,
+        'date_epoch': int(local_dt.timestamp()),
+        'day': local_dt.strftime('%Y-%m-%d')
+    }
+
+def sale_datetime(sale):
+    """Return a sale's date as a naive local datetime, or None if it has none.
+    
+    Prefers the native ``date_ts`` timestamp and only parses the ISO string
+    for documents the backfill has not reached yet.
+    """
+    date_ts = sale.get('date_ts')
+    if isinstance(date_ts, datetime):
+        return date_ts.astimezone().replace(tzinfo=None)
+    try:
+        return datetime.fromisoformat(sale.get('date', ''))
+    except (ValueError, TypeError):
+        return None
+
+def plan_sales_query(date_filter='all', customer_filter='', amount_filter='', start_date='', end_date=''):
+    """Build an indexed sales query from the sales page filters.
+
+    The equality filter on customer_name comes first, then the date and total
+    ranges. Ordered by date (see keyset_page), every combination is covered by
+    a composite index in firestore.indexes.json, so Firestore only reads the
+    documents it returns.
+    """
+    query = db.collection('sales')
+    
+    if customer_filter:
+        query = query.where('customer_name', '==', customer_filter)
+    
+    start_dt, end_dt = sales_date_bounds(date_filter, start_date, end_date)
+    if start_dt is not None:
+        query = query.where(SALE_DATE_FIELD, '>=', sale_date_value(start_dt))
+    if end_dt is not None:
+        query = query.where(SALE_DATE_FIELD, '<', sale_date_value(end_dt))
+    
+    low, high = AMOUNT_FILTER_RANGES.get(amount_filter, (None, None))
+    if low is not None:
+        query = query.where('total', '>=', low)
+    if high is not None:
+        query = query.where('total', '<=', high)
+    
+    return query
+
+def customer_sales_query(customer_name, fields=None):
+    """Return the query for one customer's sales.
+
+    An equality filter on customer_name is served by its single-field index,
+    so Firestore reads only that customer's documents. Pass ``fields`` to
+    project them.
+    """
+    query = db.collection('sales').where('customer_name', '==', customer_name)
+    return query.select(fields) if fields else query
+
+def parse_page_limit(value, default=SALES_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Parse a page size parameter, clamped to 1..maximum; a missing or bad value gives the default."""
+    try:
+        limit = int(value) if value else default
+    except (ValueError, TypeError):
+        limit = default
+    return max(1, min(limit, maximum))
+
+def parse_page_number(value):
+    """Parse a 1-based page number parameter; raises ValueError if it is not an integer.
+    
+    Page numbers are the slow path: Firestore still reads and bills every
+    document an offset skips, so deep pages cost more. Clients should follow
+    next_cursor/prev_cursor instead.
+    """
+    return max(1, int(value)) if value else 1
+
+def _cursor_default(value):
+    """JSON encoder hook for datetime values inside cursor tokens."""
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    raise TypeError(f'Cannot encode {type(value).__name__} in a cursor')
+
+def _cursor_object_hook(obj):
+    """JSON decoder hook restoring datetime values inside cursor tokens."""
+    if set(obj) == {'$dt'}:
+        return datetime.fromisoformat(obj['$dt'])
+    return obj
+
+def encode_cursor(direction, value, doc_id):
+    """Encode an opaque pagination token pointing at (value, doc_id)."""
+    payload = json.dumps({'d': direction, 'v': value, 'id': doc_id}, default=_cursor_default, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """Decode a pagination token into (direction, value, doc_id). Raises ValueError if malformed."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')), object_hook=_cursor_object_hook)
+        direction = payload['d']
+        if direction not in ('next', 'prev'):
+            raise ValueError('Invalid cursor direction')
+        return direction, payload['v'], str(payload['id'])
+    except (KeyError, TypeError, ValueError, UnicodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def keyset_page(query, order_field, cursor='', limit=SALES_PAGE_SIZE, descending=True, offset=0):
+    """Fetch one page of a query ordered by (order_field, document id).
+    
+    Cursors resolve with start-after semantics, so every page costs the same
+    number of reads no matter how deep it is. A 'prev' cursor walks the index
+    in reverse and the page is flipped back into display order. ``offset`` is
+    only used by the page-number compatibility mode when no cursor is given;
+    Firestore reads and bills every skipped document, so it is a slow path.
+    
+    Returns (docs, next_cursor, prev_cursor).
+    """
+    direction, cursor_value, cursor_id = decode_cursor(cursor) if cursor else ('next', None, None)
+    backwards = direction == 'prev'
+    
+    ascending = firestore.Query.ASCENDING
+    descending_dir = firestore.Query.DESCENDING
+    order_dir = descending_dir if descending else ascending
+    if backwards:
+        order_dir = ascending if order_dir == descending_dir else descending_dir
+    
+    document_id = FieldPath.document_id()
+    ordered = query.order_by(order_field, direction=order_dir).order_by(document_id, direction=order_dir)
+    if cursor:
+        ordered = ordered.start_after({order_field: cursor_value, document_id: cursor_id})
+    elif offset:
+        ordered = ordered.offset(offset)
+    
+    docs = list(ordered.limit(limit + 1).stream())
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    if backwards:
+        docs.reverse()
+    
+    next_cursor = None
+    prev_cursor = None
+    if docs:
+        first, last = docs[0], docs[-1]
+        if has_more or backwards:
+            next_cursor = encode_cursor('next', last.to_dict().get(order_field), last.id)
+        if (backwards and has_more) or (not backwards and (cursor or offset)):
+            prev_cursor = encode_cursor('prev', first.to_dict().get(order_field), first.id)
+    return docs, next_cursor, prev_cursor
+
+def summarize_sales_query(query):
+    """Return (transaction count, total amount) for a query using server-side aggregation."""
+    aggregation = query.count(alias='count')
+    has_sum = hasattr(aggregation, 'sum')
+    if has_sum:
+        aggregation = aggregation.sum('total', alias='total_amount')
+    
+    results = {}
+    for result_set in aggregation.get():
+        for result in result_set:
+            results[result.alias] = result.value
+    
+    count = int(results.get('count', 0))
+    if has_sum:
+        total_amount = float(results.get('total_amount') or 0)
+    else:
+        # Older clients have no sum() aggregation; only fetch the total field
+        total_amount = sum(float(doc.to_dict().get('total', 0)) for doc in query.select(['total']).stream())
+    return count, total_amount
+
+def format_sale_for_display(sale, users_map):
+    """Add the display fields (formatted date, staff name, item summary) to a sale dict."""
+    dt = sale_datetime(sale)
+    if dt:
+        sale['date_parsed'] = dt
+        sale['date'] = dt.strftime('%B %d, %Y (%I:%M %p)')
+    else:
+        sale['date_parsed'] = datetime.min
+        sale['date'] = 'Unknown'
+    
+    # Add staff name
+    staff_id = sale.get('staff_id')
+    sale['staff_name'] = users_map.get(staff_id, 'Unknown')
+    
+    # Format items for display
+    items = sale.get('items', [])
+    sale['items_display'] = ', '.join([f"{item.get('name', '')} x{item.get('quantity', 1)}" for item in items])
+    return sale
+
 @app.route('/api/sales/filtered', methods=['GET'])
 @validate_session
 @staff_required
@@ -462,185 +907,833 @@ def get_filtered_sales():
         amount_filter = request.args.get('amountFilter', '')
         start_date = request.args.get('startDate', '')
         end_date = request.args.get('endDate', '')
-        page = max(1, int(request.args.get('page', 1)))
-        limit = 20  # Results per page
-        
-        # Get sales from Firebase
-        sales_ref = db.collection('sales')
-        sales = []
-        users_map = {}
-        
-        # Preload all users for mapping user_id to name
         try:
-            for user_doc in db.collection('users').stream():
-                user = user_doc.to_dict()
-                users_map[user_doc.id] = user.get('name', user.get('username', 'Unknown'))
-        except Exception as e:
-            logger.warning(f"Error loading users for sales mapping: {e}")
+            page = parse_page_number(request.args.get('page'))
+        except ValueError:
+            return handle_validation_error('Invalid page number')
+        limit = parse_page_limit(request.args.get('limit'))
+        cursor = request.args.get('cursor', '')
         
-        # Get all sales and apply filters
-        for doc in sales_ref.stream():
-            sale = {'id': doc.id, **doc.to_dict()}
-            
-            # Parse date for filtering and sorting
-            try:
-                dt = datetime.fromisoformat(sale.get('date', ''))
-                sale['date_parsed'] = dt
-                sale['date'] = dt.strftime('%B %d, %Y (%I:%M %p)')
-            except (ValueError, TypeError):
-                sale['date_parsed'] = datetime.min
-                sale['date'] = 'Unknown'
-            
-            # Apply date filter
-            if date_filter != 'all':
-                today = datetime.now().date()
-                sale_date = sale['date_parsed'].date()
-                
-                if date_filter == 'today' and sale_date != today:
-                    continue
-                elif date_filter == 'yesterday' and sale_date != (today - timedelta(days=1)):
-                    continue
-                elif date_filter == 'week':
-                    week_ago = today - timedelta(days=7)
-                    if sale_date < week_ago:
-                        continue
-                elif date_filter == 'month':
-                    month_ago = today - timedelta(days=30)
-                    if sale_date < month_ago:
-                        continue
-                elif date_filter == 'custom' and start_date and end_date:
-                    try:
-                        start_dt = datetime.strptime(start_date, '%Y-%m-%d').date()
-                        end_dt = datetime.strptime(end_date, '%Y-%m-%d').date()
-                        if not (start_dt <= sale_date <= end_dt):
-                            continue
-                    except ValueError:
-                        pass  # Invalid date format, skip filter
-            
-            # Apply customer filter
-            if customer_filter:
-                customer_name = sale.get('customer_name', 'Walk-in Customer')
-                if customer_name != customer_filter:
-                    continue
-            
-            # Apply amount filter
-            if amount_filter:
-                total = float(sale.get('total', 0))
-                if amount_filter == '0-1000' and not (0 <= total <= 1000):
-                    continue
-                elif amount_filter == '1000-5000' and not (1000 <= total <= 5000):
-                    continue
-                elif amount_filter == '5000-10000' and not (5000 <= total <= 10000):
-                    continue
-                elif amount_filter == '10000+' and total < 10000:
-                    continue
-            
-            # Add staff name
-            staff_id = sale.get('staff_id')
-            sale['staff_name'] = users_map.get(staff_id, 'Unknown')
-            
-            # Format items for display
-            items = sale.get('items', [])
-            sale['items_display'] = ', '.join([f"{item.get('name', '')} x{item.get('quantity', 1)}" for item in items])
-            
-            sales.append(sale)
+        query = plan_sales_query(date_filter, customer_filter, amount_filter, start_date, end_date)
         
-        # Sort by date in descending order (most recent first)
-        sales.sort(key=lambda x: x['date_parsed'], reverse=True)
-        
-        # Calculate summary for all filtered results
-        total_sales_amount = sum(float(sale.get('total', 0)) for sale in sales)
-        total_transactions = len(sales)
-        average_order = total_sales_amount / total_transactions if total_transactions > 0 else 0
+        # Read only the requested page; page numbers are kept as a compatibility mode
+        try:
+            offset = 0 if cursor else (page - 1) * limit
+            docs, next_cursor, prev_cursor = keyset_page(query, SALE_DATE_FIELD, cursor, limit, offset=offset)
+        except ValueError:
+            return handle_validation_error('Invalid cursor')
         
-        # Apply pagination
-        total_results = len(sales)
-        start_index = (page - 1) * limit
-        end_index = start_index + limit
-        paginated_sales = sales[start_index:end_index]
+        paginated_sales = [{'id': doc.id, **doc.to_dict()} for doc in docs]
+        users_map = staff_names_for(paginated_sales)
+        paginated_sales = [format_sale_for_display(sale, users_map) for sale in paginated_sales]
         
-        return jsonify({
+        response = {
             'success': True, 
             'sales': paginated_sales,
-            'total': total_results,
-            'page': page,
             'limit': limit,
-            'total_pages': (total_results + limit - 1) // limit,
-            'summary': {
-                'total_sales_amount': total_sales_amount,
-                'total_transactions': total_transactions,
-                'average_order': average_order
-            }
-        })
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor
+        }
+        
+        # Totals only change with the filters, so cursor pages skip the aggregation
+        if not cursor:
+            # Daily rollups answer date and customer filters; amount ranges need the sales index
+            if amount_filter:
+                total_transactions, total_sales_amount = summarize_sales_query(query)
+            else:
+                total_transactions, total_sales_amount = summarize_sales_from_rollups(date_filter, customer_filter, start_date, end_date)
+            average_order = total_sales_amount / total_transactions if total_transactions > 0 else 0
+            response.update({
+                'total': total_transactions,
+                'page': page,
+                'total_pages': (total_transactions + limit - 1) // limit,
+                'summary': {
+                    'total_sales_amount': total_sales_amount,
+                    'total_transactions': total_transactions,
+                    'average_order': average_order
+                }
+            })
+        
+        return jsonify(response)
         
     except Exception as e:
         return handle_database_error(e, "fetching filtered sales")
 
+RECENT_SALES_LIMIT = 5
+RECENT_SALES_MAX_AGE = 30  # seconds; the reload is one limited query, so other workers' sales show up quickly
+
+class RecentSalesBuffer:
+    """Process-wide buffer of the most recent sales, newest first.
+    
+    Loaded with one ordered, limited query on first use and kept current by
+    the sale write paths, so the dashboard never scans the sales history.
+    Edits that move a sale in time or drop one from the buffer only mark it
+    stale; the next read reloads it with the same limited query. It is also
+    reloaded after ``max_age`` seconds, which picks up sales recorded by
+    other worker processes.
+    """
+    
+    def __init__(self, size=RECENT_SALES_LIMIT, max_age=RECENT_SALES_MAX_AGE):
+        self.size = size
+        self.max_age = max_age
+        self._sales = []
+        self._loaded_at = None
+        self._lock = threading.Lock()
+    
+    def _load(self):
+        query = db.collection('sales').order_by(SALE_DATE_FIELD, direction=firestore.Query.DESCENDING).limit(self.size)
+        self._sales = [{'id': doc.id, **doc.to_dict()} for doc in query.stream()]
+        self._loaded_at = time.monotonic()
+    
+    def _sort(self):
+        self._sales.sort(key=lambda sale: (sale_datetime(sale) or datetime.min, sale.get('id', '')), reverse=True)
+        del self._sales[self.size:]
+    
+    def get(self):
+        """Return copies of the buffered sales, loading them when cold or older than ``max_age``."""
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.max_age:
+                self._load()
+            return [dict(sale) for sale in self._sales]
+    
+    def add(self, sale):
+        """Record a newly created sale."""
+        with self._lock:
+            if self._loaded_at is not None:
+                self._sales.append(dict(sale))
+                self._sort()
+    
+    def update(self, sale_id, data):
+        """Apply a partial update to a sale."""
+        with self._lock:
+            if SALE_DATE_FIELD in data:
+                self._loaded_at = None
+                return
+            for sale in self._sales:
+                if sale.get('id') == sale_id:
+                    sale.update(data)
+                    break
+    
+    def remove(self, sale_id):
+        """Forget a deleted sale; the buffer is refilled on the next read."""
+        with self._lock:
+            if any(sale.get('id') == sale_id for sale in self._sales):
+                self._loaded_at = None
+    
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+recent_sales = RecentSalesBuffer()
+
 @app.route('/api/sales/recent', methods=['GET'])
 @validate_session
 def get_recent_sales():
     """Get recent sales for dashboard display (most recent 5 sales)."""
     try:
-        # Get sales from Firebase
-        sales_ref = db.collection('sales')
-        sales = []
-        users_map = {}
+        recent = recent_sales.get()
+        users_map = staff_names_for(recent)
+        recent = [format_sale_for_display(sale, users_map) for sale in recent]
         
-        # Preload all users for mapping user_id to name
-        try:
-            for user_doc in db.collection('users').stream():
-                user = user_doc.to_dict()
-                users_map[user_doc.id] = user.get('name', user.get('username', 'Unknown'))
-        except Exception as e:
-            logger.warning(f"Error loading users for sales mapping: {e}")
-        
-        # Get all sales and sort by date (most recent first)
-        for doc in sales_ref.stream():
-            sale = {'id': doc.id, **doc.to_dict()}
-            # Parse date for sorting
-            try:
-                dt = datetime.fromisoformat(sale.get('date', ''))
-                sale['date_parsed'] = dt  # Keep parsed date for sorting
-                sale['date'] = dt.strftime('%B %d, %Y (%I:%M %p)')
-            except (ValueError, TypeError):
-                sale['date_parsed'] = datetime.min  # Put invalid dates at the end
-                sale['date'] = 'Unknown'
-            
-            # Add staff name
-            staff_id = sale.get('staff_id')
-            sale['staff_name'] = users_map.get(staff_id, 'Unknown')
-            
-            # Format items for display
-            items = sale.get('items', [])
-            sale['items_display'] = ', '.join([f"{item.get('name', '')} x{item.get('quantity', 1)}" for item in items])
-            sales.append(sale)
+        return jsonify({'success': True, 'sales': recent})
         
-        # Sort by date in descending order (most recent first) and take only 5
-        sales.sort(key=lambda x: x['date_parsed'], reverse=True)
-        recent_sales = sales[:5]
+    except Exception as e:
+        return handle_database_error(e, "loading recent sales")
+
+# Daily sales rollups
+def sale_day(sale):
+    """Return the local YYYY-MM-DD bucket of a sale, or None if it has no date."""
+    if sale.get('day'):
+        return sale['day']
+    dt = sale_datetime(sale)
+    return dt.strftime('%Y-%m-%d') if dt else None
+
+def sale_rollup_contribution(sale):
+    """Return what one sale adds to its day's sales_daily document, as plain numbers."""
+    total = float(sale.get('total', 0) or 0)
+    customer_name = sale.get('customer_name', 'Walk-in Customer')
+    items = {}
+    item_revenue = {}
+    for item in sale.get('items', []):
+        item_name = item.get('name')
+        if item_name:
+            quantity = int(item.get('quantity', 1))
+            items[item_name] = items.get(item_name, 0) + quantity
+            item_revenue[item_name] = item_revenue.get(item_name, 0) + float(item.get('price', 0) or 0) * quantity
+    
+    contribution = {
+        'count': 1,
+        'gross_total': total,
+        'customers': {customer_name: {'count': 1, 'total': total}}
+    }
+    if items:
+        contribution['items'] = items
+        contribution['item_revenue'] = item_revenue
+        contribution['item_customers'] = {item_name: {customer_name: amount} for item_name, amount in item_revenue.items()}
+    staff_id = sale.get('staff_id')
+    if staff_id:
+        contribution['staff'] = {staff_id: {'count': 1, 'total': total}}
+    return contribution
+
+def merge_counts(target, source, sign=1):
+    """Add the numbers in a nested dict into ``target``, scaled by ``sign``."""
+    for key, value in source.items():
+        if isinstance(value, dict):
+            merge_counts(target.setdefault(key, {}), value, sign)
+        else:
+            target[key] = target.get(key, 0) + sign * value
+    return target
+
+def as_increments(values):
+    """Wrap every number in a nested dict in a Firestore Increment."""
+    return {
+        key: as_increments(value) if isinstance(value, dict) else firestore.Increment(value)
+        for key, value in values.items()
+        if not (isinstance(value, dict) and not value)
+    }
+
+# Per-customer statistics
+def customer_doc_id(customer_name):
+    """Return a stable document id for a customer name (names may contain '/')."""
+    return hashlib.sha1(customer_name.encode('utf-8')).hexdigest()
+
+def sale_epoch(sale):
+    """Return a sale's timestamp in epoch seconds, or None if it has no date."""
+    if sale.get('date_epoch') is not None:
+        return sale['date_epoch']
+    dt = sale_datetime(sale)
+    return dt.timestamp() if dt else None
+
+def customer_stats_contribution(sale):
+    """Return what one sale adds to its customer's customer_stats document."""
+    favorite_items = {}
+    favorite_categories = {}
+    total_items = 0
+    for item in sale.get('items', []):
+        quantity = int(item.get('quantity', 1))
+        total_items += quantity
+        if item.get('name'):
+            favorite_items[item['name']] = favorite_items.get(item['name'], 0) + quantity
+        if item.get('category'):
+            favorite_categories[item['category']] = favorite_categories.get(item['category'], 0) + quantity
+    
+    return {
+        'total_sales': 1,
+        'total_spent': float(sale.get('total', 0) or 0),
+        'total_items': total_items,
+        'favorite_items': favorite_items,
+        'favorite_categories': favorite_categories
+    }
+
+@firestore.transactional
+def refresh_purchase_span_in_transaction(transaction, customer_name):
+    """Recompute first/last purchase after one of a customer's sales was edited or removed.
+    
+    Minimum/Maximum transforms can only widen the span, so retracting a sale
+    needs two indexed reads. They run in a transaction with the stats
+    document, so a sale recorded for the customer meanwhile makes this retry.
+    The document is never deleted here; its total_sales says whether any
+    sales are left. Sales without date_ts (not backfilled yet) do not show up
+    in the reads, so finding none keeps the current span.
+    """
+    stats_ref = db.collection('customer_stats').document(customer_doc_id(customer_name))
+    stats = stats_ref.get(field_paths=['total_sales'], transaction=transaction)
+    if not stats.exists:
+        return
+    if stats.to_dict().get('total_sales', 0) <= 0:
+        # Let the customer's next sale start a new span
+        transaction.update(stats_ref, {'first_purchase_epoch': firestore.DELETE_FIELD, 'last_purchase_epoch': firestore.DELETE_FIELD})
+        return
+    query = db.collection('sales').where('customer_name', '==', customer_name).select([SALE_DATE_FIELD, 'date_epoch'])
+    latest = list(transaction.get(query.order_by(SALE_DATE_FIELD, direction=firestore.Query.DESCENDING).limit(1)))
+    earliest = list(transaction.get(query.order_by(SALE_DATE_FIELD).limit(1)))
+    if not latest:
+        return
+    transaction.update(stats_ref, {
+        'first_purchase_epoch': sale_epoch(earliest[0].to_dict()),
+        'last_purchase_epoch': sale_epoch(latest[0].to_dict())
+    })
+
+def record_sale_change(writer, old_sale=None, new_sale=None):
+    """Apply a sale create, edit or delete to the maintained sales aggregates.
+    
+    ``writer`` is the batch or transaction that writes the sale itself, so the
+    aggregates commit atomically with it. Pass ``old_sale`` to retract a
+    previous version and ``new_sale`` to add the current one. Retracting a
+    sale cannot narrow a customer's purchase span; callers follow up with
+    refresh_purchase_span_in_transaction.
+    """
+    deltas = {}
+    customer_deltas = {}
+    for sale, sign in ((old_sale, -1), (new_sale, 1)):
+        if not sale:
+            continue
+        day = sale_day(sale)
+        if day:
+            merge_counts(deltas.setdefault(day, {}), sale_rollup_contribution(sale), sign)
+        customer_name = sale.get('customer_name', 'Walk-in Customer')
+        merge_counts(customer_deltas.setdefault(customer_name, {}), customer_stats_contribution(sale), sign)
+    
+    rollups_ref = db.collection('sales_daily')
+    for day, delta in deltas.items():
+        writer.set(rollups_ref.document(day), {'day': day, **as_increments(delta)}, merge=True)
+    
+    stats_ref = db.collection('customer_stats')
+    for customer_name, delta in customer_deltas.items():
+        # last_sale_change moves on every write, even an edit that leaves the totals as they were
+        stats = {'name': customer_name, **as_increments(delta), 'last_sale_change': firestore.SERVER_TIMESTAMP}
+        epoch = sale_epoch(new_sale) if new_sale else None
+        if epoch is not None and new_sale.get('customer_name', 'Walk-in Customer') == customer_name:
+            stats['first_purchase_epoch'] = firestore.Minimum(epoch)
+            stats['last_purchase_epoch'] = firestore.Maximum(epoch)
+        writer.set(stats_ref.document(customer_doc_id(customer_name)), stats, merge=True)
+
+@firestore.transactional
+def update_sale_in_transaction(transaction, sale_ref, data):
+    """Update a sale and its aggregates together.
+    
+    Returns (old sale, new sale), or None if the sale does not exist.
+    """
+    snapshot = sale_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return None
+    old_sale = {'id': snapshot.id, **snapshot.to_dict()}
+    new_sale = {**old_sale, **data}
+    transaction.update(sale_ref, data)
+    record_sale_change(transaction, old_sale, new_sale)
+    return old_sale, new_sale
+
+@firestore.transactional
+def delete_sale_in_transaction(transaction, sale_ref):
+    """Delete a sale and retract it from the aggregates. Returns the deleted sale, if any."""
+    snapshot = sale_ref.get(transaction=transaction)
+    transaction.delete(sale_ref)
+    if not snapshot.exists:
+        return None
+    old_sale = {'id': snapshot.id, **snapshot.to_dict()}
+    record_sale_change(transaction, old_sale=old_sale)
+    return old_sale
+
+def rollup_days_query(start_dt, end_dt):
+    """Return the sales_daily query for days in [start_dt, end_dt); either bound may be None."""
+    query = db.collection('sales_daily')
+    if start_dt is not None:
+        query = query.where('day', '>=', start_dt.strftime('%Y-%m-%d'))
+    if end_dt is not None:
+        query = query.where('day', '<', end_dt.strftime('%Y-%m-%d'))
+    return query
+
+def summarize_sales_from_rollups(date_filter='all', customer_filter='', start_date='', end_date=''):
+    """Return (transaction count, total amount) by reading one rollup document per day."""
+    start_dt, end_dt = sales_date_bounds(date_filter, start_date, end_date)
+    query = rollup_days_query(start_dt, end_dt).select(['customers'] if customer_filter else ['count', 'gross_total'])
+    
+    count = 0
+    total_amount = 0.0
+    for doc in query.stream():
+        rollup = doc.to_dict()
+        if customer_filter:
+            entry = rollup.get('customers', {}).get(customer_filter, {})
+            count += int(entry.get('count', 0))
+            total_amount += float(entry.get('total', 0))
+        else:
+            count += int(rollup.get('count', 0))
+            total_amount += float(rollup.get('gross_total', 0))
+    return count, total_amount
+
+# Columnar analytics engine
+SALES_ENGINE_MAX_AGE = 600  # seconds; this process's sales are added as they happen, a background reload picks up other processes' writes
+
+sales_engine = SalesColumns()
+
+SALES_ENGINE_FIELDS = ['customer_name', 'items', 'total', 'staff_id', 'date', 'date_ts']
+
+def load_sales_records(query=None):
+    """Yield (sale_id, sale, datetime) records for the analytics engine."""
+    query = query if query is not None else db.collection('sales').select(SALES_ENGINE_FIELDS)
+    for doc in query.stream():
+        sale = doc.to_dict()
+        yield doc.id, sale, sale_datetime(sale)
+
+def get_sales_engine():
+    """Return the analytics engine, loading it on first use and when stale."""
+    sales_engine.refresh(load_sales_records, SALES_ENGINE_MAX_AGE)
+    return sales_engine
+
+def get_customer_engine(customer_name):
+    """Return an analytics engine holding at least one customer's sales.
+    
+    A loaded shared engine is reused (a stale one reloads in the background);
+    otherwise only that customer's sales are loaded through
+    customer_sales_query instead of the whole collection.
+    """
+    if sales_engine.loaded_at is not None:
+        return get_sales_engine()
+    columns = SalesColumns()
+    columns.load(load_sales_records(customer_sales_query(customer_name, SALES_ENGINE_FIELDS)))
+    return columns
+
+TOP_ITEMS_MAX_LIMIT = 50
+
+@app.route('/api/sales/top-items', methods=['GET'])
+@validate_session
+def get_top_selling_items():
+    """Get the best-selling items for a period from the per-day item counters.
+    
+    Accepts the same period values as the sales date filter (all, today,
+    yesterday, week, month, custom with startDate/endDate), a ``limit`` and
+    ``sort`` (units or revenue). Only one rollup document per day is read.
+    """
+    try:
+        period = request.args.get('period', 'all')
+        start_date = request.args.get('startDate', '')
+        end_date = request.args.get('endDate', '')
+        sort_by = request.args.get('sort', 'units')
+        if sort_by not in ('units', 'revenue'):
+            return handle_validation_error('sort must be units or revenue')
+        limit = parse_page_limit(request.args.get('limit'), 5, TOP_ITEMS_MAX_LIMIT)
+        
+        start_dt, end_dt = sales_date_bounds(period, start_date, end_date)
+        
+        units = {}
+        revenue = {}
+        for doc in rollup_days_query(start_dt, end_dt).select(['items', 'item_revenue']).stream():
+            rollup = doc.to_dict()
+            merge_counts(units, rollup.get('items', {}))
+            merge_counts(revenue, rollup.get('item_revenue', {}))
+        
+        ranking = units if sort_by == 'units' else revenue
+        top_names = heapq.nlargest(limit, (name for name in ranking if units.get(name, 0) > 0), key=lambda name: ranking[name])
+        
+        # Category and current stock come from the inventory mirror, for the top items only
+        top_items = []
+        for name in top_names:
+            inventory_item = inventory_mirror.find_by_name(name) or {}
+            top_items.append({
+                'name': name,
+                'category': inventory_item.get('category', 'Uncategorized'),
+                'units_sold': units.get(name, 0),
+                'revenue': revenue.get(name, 0.0),
+                'stock_level': inventory_item.get('stock', 0)
+            })
         
-        return jsonify({'success': True, 'sales': recent_sales})
+        return jsonify({'success': True, 'top_items': top_items, 'period': period})
         
     except Exception as e:
-        return handle_database_error(e, "loading recent sales")
+        return handle_database_error(e, "loading top selling items")
+
+# Inventory mirror
+INVENTORY_MIRROR_READY_TIMEOUT = 10  # seconds to wait for the listener's first snapshot
+INVENTORY_SEARCH_LIMIT = 20
+INVENTORY_SEARCH_MAX_LIMIT = 200
+LOW_STOCK_THRESHOLD = 5  # same cut-off as the inventory page's low-stock badge
+
+def search_tokens(text):
+    """Split text into lowercase word tokens for the inventory search index."""
+    return re.findall(r'\w+', str(text or '').lower())
+
+def stored_number(value, kind=float):
+    """Coerce a stored stock or price, which older versions may have saved as a string; bad values count as 0."""
+    try:
+        return kind(float(value or 0))
+    except (ValueError, TypeError, OverflowError):
+        return kind(0)
+
+class InventoryMirror:
+    """Process-wide in-memory copy of the inventory collection.
+    
+    Loaded once on first use. With Firestore, a realtime snapshot listener
+    then applies every change made by any process, in order. The inventory
+    write paths also apply their own changes as soon as they commit, so this
+    process reads its writes straight away. Each document's update_time from
+    the listener is kept, and a local write is skipped when the listener has
+    already delivered that version or a newer one; ids the listener reported
+    removed are never re-added. If the listener stops or fails to apply a
+    change, the next read rebuilds the mirror from a new listener.
+    A list of (lowercase name, id) pairs is kept sorted with bisect, so the
+    name-ordered view is never re-sorted and reads cost no database reads.
+    
+    Search indexes are maintained alongside it: a sorted list of (token, id)
+    pairs over name and category words for prefix matches, and id sets per
+    category and per supplier. Each supplier also keeps running totals (item
+    count, stock value, low-stock count) that every change adjusts; the stock
+    value is kept in whole cents so adding and removing an item cancels out
+    exactly.
+    """
+    
+    def __init__(self):
+        self._loaded = False
+        self._watch = None
+        self._watch_failed = False
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._reset()
+    
+    def _reset(self):
+        self._items = {}
+        self._order = []
+        self._tokens = []
+        self._by_category = {}
+        self._by_supplier = {}
+        self._supplier_totals = {}
+        self._versions = {}
+        self._removed = set()
+    
+    @staticmethod
+    def _sort_key(item_id, item):
+        return (str(item.get('name', '')).lower(), item_id)
+    
+    @staticmethod
+    def _item_tokens(item):
+        return set(search_tokens(item.get('name'))) | set(search_tokens(item.get('category')))
+    
+    def _put(self, item_id, item):
+        self._drop(item_id)
+        item = {**item, 'id': item_id}
+        self._items[item_id] = item
+        bisect.insort(self._order, self._sort_key(item_id, item))
+        for token in self._item_tokens(item):
+            bisect.insort(self._tokens, (token, item_id))
+        self._by_category.setdefault(str(item.get('category', '')).lower(), set()).add(item_id)
+        self._by_supplier.setdefault(str(item.get('supplier', '')).lower(), set()).add(item_id)
+        self._count_supplier(item, 1)
+    
+    def _drop(self, item_id):
+        old = self._items.pop(item_id, None)
+        if old is None:
+            return
+        self._discard(self._order, self._sort_key(item_id, old))
+        for token in self._item_tokens(old):
+            self._discard(self._tokens, (token, item_id))
+        self._count_supplier(old, -1)
+        for index, value in ((self._by_category, old.get('category', '')), (self._by_supplier, old.get('supplier', ''))):
+            ids = index.get(str(value).lower())
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del index[str(value).lower()]
+    
+    def _count_supplier(self, item, sign):
+        key = str(item.get('supplier', '')).lower()
+        totals = self._supplier_totals.setdefault(key, {'item_count': 0, 'stock_value_cents': 0, 'low_stock_count': 0})
+        stock = stored_number(item.get('stock'), int)
+        totals['item_count'] += sign
+        totals['stock_value_cents'] += sign * round(stock * stored_number(item.get('price')) * 100)
+        totals['low_stock_count'] += sign * (stock <= LOW_STOCK_THRESHOLD)
+        if not totals['item_count']:
+            del self._supplier_totals[key]
+    
+    @staticmethod
+    def _discard(entries, key):
+        index = bisect.bisect_left(entries, key)
+        if index < len(entries) and entries[index] == key:
+            del entries[index]
+    
+    def _on_snapshot(self, collection_snapshot, changes, read_time):
+        try:
+            with self._lock:
+                for change in changes:
+                    item_id = change.document.id
+                    if change.type.name == 'REMOVED':
+                        self._drop(item_id)
+                        self._versions.pop(item_id, None)
+                        self._removed.add(item_id)
+                    else:
+                        self._put(item_id, change.document.to_dict())
+                        self._versions[item_id] = change.document.update_time
+        except Exception as e:
+            # The mirror may now be missing this change; the next read rebuilds it
+            logger.error(f"Inventory listener could not apply a change: {e}")
+            self._watch_failed = True
+        self._ready.set()
+    
+    def _listening(self):
+        """False once the listener has stopped (the client retries transient errors itself) or failed."""
+        watch = self._watch
+        return watch is None or (watch.is_active and not self._watch_failed)
+    
+    def _ensure_loaded(self):
+        if self._loaded and self._listening():
+            return
+        # Not self._lock: the listener thread needs it to deliver the first snapshot
+        with self._load_lock:
+            if self._loaded and self._listening():
+                return
+            if self._watch is not None:
+                logger.warning('Inventory listener stopped; reloading the inventory mirror')
+                self._watch.unsubscribe()
+                self._watch = None
+            with self._lock:
+                self._loaded = False
+                self._reset()
+            self._watch_failed = False
+            self._ready.clear()
+            if use_firebase:
+                # The first snapshot delivers every document as ADDED
+                self._watch = db.collection('inventory').on_snapshot(self._on_snapshot)
+                if not self._ready.wait(INVENTORY_MIRROR_READY_TIMEOUT) or self._watch_failed:
+                    self._watch.unsubscribe()
+                    self._watch = None
+                    raise RuntimeError('Could not load the inventory through the listener')
+            else:
+                with self._lock:
+                    for doc in db.collection('inventory').stream():
+                        self._put(doc.id, doc.to_dict())
+            self._loaded = True
+    
+    def items(self, start=0, end=None):
+        """Return copies of the items in name order, optionally one slice of them, and the total count."""
+        self._ensure_loaded()
+        with self._lock:
+            keys = self._order[start:end]
+            return [dict(self._items[item_id]) for _, item_id in keys], len(self._order)
+    
+    def get(self, item_id):
+        """Return a copy of one item, or None."""
+        self._ensure_loaded()
+        with self._lock:
+            item = self._items.get(item_id)
+            return dict(item) if item else None
+    
+    def find_by_name(self, name):
+        """Return a copy of the first item with exactly this name, or None."""
+        self._ensure_loaded()
+        with self._lock:
+            index = bisect.bisect_left(self._order, (str(name).lower(), ''))
+            while index < len(self._order) and self._order[index][0] == str(name).lower():
+                item = self._items[self._order[index][1]]
+                if item.get('name') == name:
+                    return dict(item)
+                index += 1
+            return None
+    
+    def search(self, query='', category='', supplier='', in_stock=False, limit=INVENTORY_SEARCH_LIMIT):
+        """Return (top matching items, total match count).
+        
+        Every word of ``query`` must prefix a name or category word; items
+        whose name starts with the whole query rank first, then name order.
+        ``category`` and ``supplier`` match exactly, ignoring case.
+        """
+        self._ensure_loaded()
+        prefix = ' '.join(query.lower().split())
+        with self._lock:
+            candidates = None
+            for token in search_tokens(query):
+                start = bisect.bisect_left(self._tokens, (token, ''))
+                end = bisect.bisect_left(self._tokens, (token + chr(0x10FFFF), ''))
+                matched = {item_id for _, item_id in self._tokens[start:end]}
+                candidates = matched if candidates is None else candidates & matched
+            for index, value in ((self._by_category, category), (self._by_supplier, supplier)):
+                if value:
+                    matched = index.get(value.lower(), set())
+                    candidates = set(matched) if candidates is None else candidates & matched
+            
+            def stocked(item_id):
+                return not in_stock or stored_number(self._items[item_id].get('stock'), int) > 0
+            
+            if candidates is None:
+                # No query or filters: the name-ordered view already is the ranking
+                ids = [item_id for _, item_id in self._order if stocked(item_id)]
+                top = ids[:limit]
+            else:
+                ids = [item_id for item_id in candidates if stocked(item_id)]
+                def rank(item_id):
+                    item = self._items[item_id]
+                    return (not str(item.get('name', '')).lower().startswith(prefix), self._sort_key(item_id, item))
+                top = heapq.nsmallest(limit, ids, key=rank)
+            return [dict(self._items[item_id]) for item_id in top], len(ids)
+    
+    def supplier_items(self, supplier):
+        """Return (copies of a supplier's items in name order, the supplier's totals); matches ignore case."""
+        self._ensure_loaded()
+        key = str(supplier).lower()
+        with self._lock:
+            ids = self._by_supplier.get(key, set())
+            items = [dict(self._items[item_id]) for item_id in sorted(ids, key=lambda item_id: self._sort_key(item_id, self._items[item_id]))]
+            return items, self._supplier_summary(key)
+    
+    def _supplier_summary(self, supplier):
+        totals = self._supplier_totals.get(str(supplier).lower())
+        if totals is None:
+            return {'item_count': 0, 'stock_value': 0.0, 'low_stock_count': 0}
+        return {
+            'item_count': totals['item_count'],
+            'stock_value': totals['stock_value_cents'] / 100,
+            'low_stock_count': totals['low_stock_count']
+        }
+    
+    def supplier_summaries(self, suppliers):
+        """Return {supplier: totals} for several supplier names."""
+        self._ensure_loaded()
+        with self._lock:
+            return {supplier: self._supplier_summary(supplier) for supplier in suppliers}
+    
+    # Local write hooks, called after a write commits with its commit time
+    # (None without Firestore); a listener event may arrive before or after them
+    def _superseded(self, item_id, version):
+        if item_id in self._removed:
+            return True
+        known = self._versions.get(item_id)
+        return version is not None and known is not None and known >= version
+    
+    def apply_write(self, item_id, data, version=None):
+        """Record a created or updated item (``data`` may be a partial update)."""
+        with self._lock:
+            if self._loaded and not self._superseded(item_id, version):
+                self._put(item_id, {**self._items.get(item_id, {}), **data})
+    
+    def apply_delete(self, item_id, version=None):
+        """Record a deleted item."""
+        with self._lock:
+            if self._loaded:
+                self._drop(item_id)
+                self._versions.pop(item_id, None)
+                self._removed.add(item_id)
+    
+    def apply_stock_levels(self, levels, version=None):
+        """Record the stock a sale left items at, as {item_id: stock}.
+        
+        Absolute levels rather than increments, so applying them after the
+        listener has already delivered the same change does not count it twice.
+        """
+        with self._lock:
+            if self._loaded:
+                for item_id, stock in levels.items():
+                    item = self._items.get(item_id)
+                    if item is not None and not self._superseded(item_id, version):
+                        self._count_supplier(item, -1)
+                        item['stock'] = stock
+                        self._count_supplier(item, 1)
+
+inventory_mirror = InventoryMirror()
+
+# Inventory uniqueness keys
+def inventory_key_ref(name, category):
+    """Return the inventory_keys document reserving an item's normalized (name, category) pair."""
+    normalized = '|'.join(' '.join(str(value or '').lower().split()) for value in (name, category))
+    return db.collection('inventory_keys').document(hashlib.sha1(normalized.encode('utf-8')).hexdigest())
+
+# Category item counts
+def category_refs_by_name(names):
+    """Return {category name: document reference} for those of ``names`` that are categories."""
+    refs = {}
+    for name in {name for name in names if name}:
+        for doc in db.collection('categories').where('name', '==', name).limit(1).stream():
+            refs[name] = doc.reference
+    return refs
+
+def record_category_move(writer, old_category=None, new_category=None):
+    """Move one item between category item_count counters.
+    
+    ``writer`` is the batch or transaction that writes the item itself, so the
+    counters change atomically with it. Pass only ``new_category`` for a
+    created item and only ``old_category`` for a deleted one.
+    """
+    if old_category == new_category:
+        return
+    refs = category_refs_by_name([old_category, new_category])
+    if old_category in refs:
+        writer.update(refs[old_category], {'item_count': firestore.Increment(-1)})
+    if new_category in refs:
+        writer.update(refs[new_category], {'item_count': firestore.Increment(1)})
+
+def count_category_items(name):
+    """Count the inventory items in a category with a server-side aggregation."""
+    results = {}
+    for result_set in db.collection('inventory').where('category', '==', name).count(alias='count').get():
+        for result in result_set:
+            results[result.alias] = result.value
+    return int(results.get('count', 0))
+
+@firestore.transactional
+def create_inventory_item_in_transaction(transaction, item_ref, data):
+    """Reserve an item's (name, category) key, create the item and count it in its category.
+    
+    Returns False, writing nothing, if another item already holds the key.
+    """
+    key_ref = inventory_key_ref(data['name'], data['category'])
+    if key_ref.get(transaction=transaction).exists:
+        return False
+    transaction.create(key_ref, {'item_id': item_ref.id})
+    transaction.set(item_ref, data)
+    record_category_move(transaction, new_category=data['category'])
+    return True
+
+@firestore.transactional
+def update_inventory_item_in_transaction(transaction, item_ref, data):
+    """Update an item, moving its key reservation and category count with it.
+    
+    Returns 'updated', 'not_found', or 'duplicate' if the new name and
+    category are reserved by another item.
+    """
+    snapshot = item_ref.get(field_paths=['name', 'category'], transaction=transaction)
+    if not snapshot.exists:
+        return 'not_found'
+    old_item = snapshot.to_dict()
+    old_key_ref = inventory_key_ref(old_item.get('name'), old_item.get('category'))
+    new_key_ref = inventory_key_ref(data.get('name', old_item.get('name')), data.get('category', old_item.get('category')))
+    if new_key_ref.id != old_key_ref.id:
+        keys = {key.id: key for key in transaction.get_all([old_key_ref, new_key_ref])}
+        if keys[new_key_ref.id].exists and keys[new_key_ref.id].get('item_id') != item_ref.id:
+            return 'duplicate'
+        if keys[old_key_ref.id].exists and keys[old_key_ref.id].get('item_id') == item_ref.id:
+            transaction.delete(old_key_ref)
+        transaction.set(new_key_ref, {'item_id': item_ref.id})
+    transaction.update(item_ref, data)
+    record_category_move(transaction, old_item.get('category'), data.get('category', old_item.get('category')))
+    return 'updated'
+
+@firestore.transactional
+def delete_inventory_item_in_transaction(transaction, item_ref):
+    """Delete an item, releasing its key and taking it off its category count. Returns False if it does not exist."""
+    snapshot = item_ref.get(field_paths=['name', 'category'], transaction=transaction)
+    if not snapshot.exists:
+        return False
+    old_item = snapshot.to_dict()
+    key_ref = inventory_key_ref(old_item.get('name'), old_item.get('category'))
+    key = key_ref.get(transaction=transaction)
+    if key.exists and key.get('item_id') == item_ref.id:
+        transaction.delete(key_ref)
+    transaction.delete(item_ref)
+    record_category_move(transaction, old_category=old_item.get('category'))
+    return True
 
 # Inventory Management Routes
+@app.route('/api/inventory/search', methods=['GET'])
+@validate_session
+def search_inventory():
+    """Search inventory by name or category word prefixes, with category, supplier and stock filters."""
+    try:
+        limit = parse_page_limit(request.args.get('limit'), INVENTORY_SEARCH_LIMIT, INVENTORY_SEARCH_MAX_LIMIT)
+        items, total = inventory_mirror.search(
+            request.args.get('q', ''),
+            category=request.args.get('category', ''),
+            supplier=request.args.get('supplier', ''),
+            in_stock=request.args.get('in_stock', '').lower() in ('1', 'true', 'yes'),
+            limit=limit
+        )
+        return jsonify({'success': True, 'items': items, 'total': total, 'limit': limit})
+    except Exception as e:
+        return handle_database_error(e, "searching inventory")
+
+@app.route('/api/inventory/supplier/<path:supplier_name>', methods=['GET'])
+@validate_session
+def get_inventory_by_supplier(supplier_name):
+    """Return a supplier's items with its item count, stock value and low-stock count."""
+    try:
+        supplier_name = unquote(supplier_name)
+        items, summary = inventory_mirror.supplier_items(supplier_name)
+        return jsonify({'success': True, 'supplier': supplier_name, 'items': items, 'summary': summary})
+    except Exception as e:
+        return handle_database_error(e, "fetching supplier inventory")
+
 @app.route('/api/inventory', methods=['GET', 'POST'])
 @validate_session
 def inventory_api():
     """Inventory API with enhanced security and validation."""
     if request.method == 'GET':
         try:
-            inventory_ref = db.collection('inventory')
-            inventory = []
-            for doc in inventory_ref.stream():
-                item_data = doc.to_dict()
-                item_data['id'] = doc.id
-                inventory.append(item_data)
-            
-            # Sort by name (case-insensitive)
-            inventory.sort(key=lambda x: x.get('name', '').lower())
-            
             # Optional pagination
             try:
                 page = max(1, int(request.args.get('page', 1)))
@@ -649,14 +1742,14 @@ def inventory_api():
                 page = 1
                 limit = 0
             
+            # Served from the in-memory mirror, already sorted by name (case-insensitive)
             if limit > 0:
                 start = (page - 1) * limit
-                end = start + limit
-                paginated = inventory[start:end]
+                paginated, total = inventory_mirror.items(start, start + limit)
             else:
-                paginated = inventory
+                paginated, total = inventory_mirror.items()
             
-            return jsonify({'success': True, 'inventory': paginated, 'total': len(inventory)})
+            return jsonify({'success': True, 'inventory': paginated, 'total': total})
         except Exception as e:
             return handle_database_error(e, "fetching inventory")
     
@@ -704,12 +1797,6 @@ def inventory_api():
                 except Exception:
                     category_name = data['category']
             
-            # Duplicate check (same name and category)
-            inventory_ref = db.collection('inventory')
-            duplicate_query = inventory_ref.where('name', '==', data['name']).where('category', '==', category_name).stream()
-            if any(True for _ in duplicate_query):
-                return handle_validation_error('An item with this name and category already exists.')
-            
             # Prepare data for storage
             inventory_data = {
                 'name': data['name'],
@@ -721,12 +1808,16 @@ def inventory_api():
                 'updated_at': datetime.now().isoformat()
             }
             
-            # Add item
-            doc_ref = inventory_ref.add(inventory_data)
+            # Add item; its (name, category) reservation rejects duplicates
+            doc_ref = db.collection('inventory').document()
+            transaction = db.transaction()
+            if not create_inventory_item_in_transaction(transaction, doc_ref, inventory_data):
+                return handle_validation_error('An item with this name and category already exists.')
+            inventory_mirror.apply_write(doc_ref.id, inventory_data, transaction.commit_time)
             return jsonify({
                 'success': True, 
                 'message': 'Inventory item created successfully', 
-                'item_id': doc_ref[1].id
+                'item_id': doc_ref.id
             })
             
         except Exception as e:
@@ -739,10 +1830,8 @@ def manage_inventory_item(item_id):
     """Manage individual inventory item with enhanced security."""
     try:
         if request.method == 'GET':
-            item = db.collection('inventory').document(item_id).get()
-            if item.exists:
-                item_data = item.to_dict()
-                item_data['id'] = item_id
+            item_data = inventory_mirror.get(item_id)
+            if item_data:
                 return jsonify({'success': True, 'item': item_data})
             return handle_not_found_error('Item')
         
@@ -785,13 +1874,6 @@ def manage_inventory_item(item_id):
                 except Exception:
                     category_name = data['category']
             
-            # Check for duplicates (excluding current item)
-            inventory_ref = db.collection('inventory')
-            duplicate_query = inventory_ref.where('name', '==', data['name']).where('category', '==', category_name).stream()
-            for doc in duplicate_query:
-                if doc.id != item_id:
-                    return handle_validation_error('An item with this name and category already exists.')
-            
             # Prepare update data
             update_data = {
                 'name': data['name'],
@@ -802,21 +1884,331 @@ def manage_inventory_item(item_id):
                 'updated_at': datetime.now().isoformat()
             }
             
-            db.collection('inventory').document(item_id).update(update_data)
+            item_ref = db.collection('inventory').document(item_id)
+            transaction = db.transaction()
+            result = update_inventory_item_in_transaction(transaction, item_ref, update_data)
+            if result == 'not_found':
+                return handle_not_found_error('Item')
+            if result == 'duplicate':
+                return handle_validation_error('An item with this name and category already exists.')
+            inventory_mirror.apply_write(item_id, update_data, transaction.commit_time)
             return jsonify({'success': True, 'message': 'Item updated successfully'})
         
         elif request.method == 'DELETE':
-            # Check if item exists before deleting
-            item = db.collection('inventory').document(item_id).get()
-            if not item.exists:
+            item_ref = db.collection('inventory').document(item_id)
+            transaction = db.transaction()
+            if not delete_inventory_item_in_transaction(transaction, item_ref):
                 return handle_not_found_error('Item')
-            
-            db.collection('inventory').document(item_id).delete()
+            inventory_mirror.apply_delete(item_id, transaction.commit_time)
             return jsonify({'success': True, 'message': 'Item deleted successfully'})
     
     except Exception as e:
         return handle_database_error(e, "managing inventory item")
 
+FIRESTORE_MAX_BATCH_WRITES = 500
+
+def commit_writes_in_batches(writes, batch_size=FIRESTORE_MAX_BATCH_WRITES):
+    """Commit (operation, ref, data) writes, batch_size per batch; returns the last batch's commit time.
+    
+    ``operation`` names a WriteBatch method: create, set, update or delete
+    (which ignores ``data``).
+    """
+    commit_time = None
+    for start in range(0, len(writes), batch_size):
+        batch = db.batch()
+        for operation, ref, data in writes[start:start + batch_size]:
+            if operation == 'delete':
+                batch.delete(ref)
+            else:
+                getattr(batch, operation)(ref, data)
+        batch.commit()
+        commit_time = batch.commit_time
+    return commit_time
+
+# Bulk inventory import
+BULK_IMPORT_MAX_ROWS = 50000
+BULK_IMPORT_CHUNK_ROWS = 500  # rows validated together; their keys are fetched with one get_all
+BULK_ROW_MAX_WRITES = 5  # old key delete, new key write, item write and two category counters
+BULK_IMPORT_FORMATS = {
+    'csv': 'csv', 'text/csv': 'csv', 'application/vnd.ms-excel': 'csv',
+    'jsonl': 'jsonl', 'ndjson': 'jsonl', 'application/x-ndjson': 'jsonl',
+    'application/jsonl': 'jsonl', 'application/json-lines': 'jsonl'
+}
+
+def bulk_import_format(upload):
+    """Return 'csv' or 'jsonl' from the format parameter, the content type or the file extension."""
+    candidates = [request.args.get('format', '').lower()]
+    if upload is not None:
+        candidates += [upload.mimetype, upload.filename.rsplit('.', 1)[-1].lower() if upload.filename else '']
+    else:
+        candidates.append(request.mimetype)
+    for candidate in candidates:
+        if candidate in BULK_IMPORT_FORMATS:
+            return BULK_IMPORT_FORMATS[candidate]
+    return None
+
+def read_bulk_rows(stream, upload_format):
+    """Yield (line number, row dict or None) from an upload, decoding it as it is read."""
+    lines = codecs.getreader('utf-8-sig')(stream)
+    if upload_format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+    else:
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, {str(key).strip().lower(): value for key, value in row.items()} if isinstance(row, dict) else None
+
+def validate_bulk_row(row, categories, suppliers):
+    """Return the fields present in a row, normalized, or raise ValueError with the row's error.
+    
+    ``categories`` and ``suppliers`` map lowercase names (and category ids)
+    to the stored names; they are loaded once per upload.
+    """
+    if row is None:
+        raise ValueError('Row is not a JSON object')
+    fields = {}
+    if str(row.get('id') or '').strip():
+        fields['id'] = str(row['id']).strip()
+    for field in ('name', 'category', 'supplier'):
+        value = row.get(field)
+        if value is not None and str(value).strip():
+            fields[field] = sanitize_input(str(value).strip())
+    if 'category' in fields:
+        category = categories.get(fields['category']) or categories.get(fields['category'].lower())
+        if category is None:
+            raise ValueError(f"Unknown category: {fields['category']}")
+        fields['category'] = category
+    if 'supplier' in fields:
+        supplier = suppliers.get(fields['supplier'].lower())
+        if supplier is None:
+            raise ValueError(f"Unknown supplier: {fields['supplier']}")
+        fields['supplier'] = supplier
+    try:
+        if row.get('stock') not in (None, ''):
+            fields['stock'] = int(row['stock'])
+        if row.get('price') not in (None, ''):
+            fields['price'] = float(row['price'])
+    except (ValueError, TypeError):
+        raise ValueError('Stock must be an integer and price must be a number')
+    if fields.get('stock', 0) < 0 or fields.get('price', 0) < 0:
+        raise ValueError('Stock and price must be non-negative')
+    if 'id' not in fields and not ('name' in fields and 'category' in fields):
+        raise ValueError('Each row needs an id, or a name and category')
+    return fields
+
+class BulkInventoryWriter:
+    """Turns validated rows into item, key and category counter writes, committed in full batches.
+    
+    Rows with an id update that item; rows without one update the item that
+    holds their (name, category) key, or create a new item. Keys reserved or
+    released earlier in the upload are tracked, so duplicates within the file
+    are caught too. New reservations use ``create``, so a concurrent write of
+    the same key fails its batch instead of producing a duplicate.
+    """
+    
+    def __init__(self, category_refs):
+        self.category_refs = category_refs
+        self.keys = {}
+        self.items = {}
+        self.errors = []
+        self.created = 0
+        self.updated = 0
+        self._pending = []
+        self._pending_writes = 0
+        self._category_deltas = {}
+    
+    def write_chunk(self, rows):
+        """Apply one chunk of (line number, fields) rows."""
+        refs = {}
+        for _, fields in rows:
+            # The key a row ends up with and, for id rows, the key the item holds now
+            items = [fields]
+            if 'id' in fields and self._current_item(fields['id']):
+                item = self._current_item(fields['id'])
+                items = [item, {**item, **fields}]
+            for item in items:
+                key_ref = inventory_key_ref(item.get('name'), item.get('category'))
+                refs[key_ref.id] = key_ref
+        self._read_keys([ref for key_id, ref in refs.items() if key_id not in self.keys])
+        
+        for number, fields in rows:
+            try:
+                self._write_row(number, fields)
+            except ValueError as e:
+                self.errors.append({'row': number, 'error': str(e)})
+    
+    def _read_keys(self, refs):
+        found = {snapshot.id: snapshot for snapshot in db.get_all(refs)}
+        for ref in refs:
+            snapshot = found.get(ref.id)
+            self.keys[ref.id] = snapshot.get('item_id') if snapshot is not None and snapshot.exists else None
+    
+    def _current_item(self, item_id):
+        if item_id not in self.items:
+            self.items[item_id] = inventory_mirror.get(item_id)
+        return self.items[item_id]
+    
+    def _write_row(self, number, fields):
+        # Make room for this row's worst case first: a failed flush changes the
+        # keys and items the row is resolved against
+        counters = sum(1 for name in self._category_deltas if name in self.category_refs)
+        if self._pending_writes + counters + BULK_ROW_MAX_WRITES > FIRESTORE_MAX_BATCH_WRITES:
+            self.flush()
+        
+        item_id = fields.pop('id', None)
+        if item_id is None:
+            item_id = self.keys.get(inventory_key_ref(fields['name'], fields['category']).id)
+        old_item = self._current_item(item_id) if item_id else None
+        if item_id and old_item is None:
+            raise ValueError(f'Item not found: {item_id}')
+        
+        now = datetime.now().isoformat()
+        writes = []
+        key_changes = {}
+        if old_item is None:
+            missing = [field for field in ('name', 'category', 'stock', 'price', 'supplier') if field not in fields]
+            if missing:
+                raise ValueError(f'Missing required field: {missing[0]}')
+            item_ref = db.collection('inventory').document()
+            new_item = {**fields, 'created_at': now, 'updated_at': now}
+            key_ref = inventory_key_ref(new_item['name'], new_item['category'])
+            writes.append(('create', key_ref, {'item_id': item_ref.id}))
+            writes.append(('set', item_ref, new_item))
+            key_changes[key_ref.id] = item_ref.id
+        else:
+            item_ref = db.collection('inventory').document(item_id)
+            update = {**fields, 'updated_at': now}
+            new_item = {**old_item, **update}
+            old_key_ref = inventory_key_ref(old_item.get('name'), old_item.get('category'))
+            key_ref = inventory_key_ref(new_item.get('name'), new_item.get('category'))
+            if key_ref.id != old_key_ref.id:
+                if self.keys.get(key_ref.id) not in (None, item_id):
+                    raise ValueError('An item with this name and category already exists.')
+                if self.keys.get(old_key_ref.id) == item_id:
+                    writes.append(('delete', old_key_ref, None))
+                    key_changes[old_key_ref.id] = None
+                writes.append(('create' if self.keys.get(key_ref.id) is None else 'set', key_ref, {'item_id': item_id}))
+                key_changes[key_ref.id] = item_id
+            writes.append(('update', item_ref, update))
+        
+        deltas = {}
+        if old_item is None or old_item.get('category') != new_item['category']:
+            deltas[new_item['category']] = 1
+            if old_item is not None:
+                deltas[old_item.get('category')] = -1
+        self._pending.append((number, item_ref.id, new_item, writes, old_item is None))
+        self._pending_writes += len(writes)
+        for name, delta in deltas.items():
+            self._category_deltas[name] = self._category_deltas.get(name, 0) + delta
+        self.keys.update(key_changes)
+        self.items[item_ref.id] = new_item
+        if old_item is None:
+            self.created += 1
+        else:
+            self.updated += 1
+    
+    def flush(self):
+        """Commit the pending rows and their category counter changes as one batch."""
+        if not self._pending:
+            return
+        # _write_row flushes before the pending writes outgrow one batch
+        writes = [write for _, _, _, row_writes, _ in self._pending for write in row_writes]
+        for name, delta in self._category_deltas.items():
+            if delta and name in self.category_refs:
+                writes.append(('update', self.category_refs[name], {'item_count': firestore.Increment(delta)}))
+        try:
+            commit_time = commit_writes_in_batches(writes)
+        except Exception as e:
+            logger.warning(f"Bulk inventory batch failed: {e}")
+            for number, item_id, _, _, is_new in self._pending:
+                self.errors.append({'row': number, 'error': 'Not saved: a concurrent change conflicted with this batch; retry the row'})
+                self.items.pop(item_id, None)
+                if is_new:
+                    self.created -= 1
+                else:
+                    self.updated -= 1
+            # What the reservations hold is unknown now; re-read the ones this batch touched
+            key_refs = {ref.id: ref for _, _, _, writes, _ in self._pending for _, ref, _ in writes if ref.id in self.keys}
+            self._read_keys(list(key_refs.values()))
+        else:
+            for _, item_id, new_item, _, _ in self._pending:
+                inventory_mirror.apply_write(item_id, new_item, commit_time)
+        self._pending = []
+        self._pending_writes = 0
+        self._category_deltas = {}
+
+@app.route('/api/inventory/bulk', methods=['POST'])
+@validate_session
+@staff_required
+def bulk_inventory():
+    """Create and update inventory items from a CSV or JSON lines upload.
+    
+    The upload is the request body, or a multipart ``file`` field. Columns
+    or keys: id, name, category, stock, price, supplier. Rows are applied
+    independently; the response reports every row that was not saved.
+    """
+    try:
+        upload = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+        upload_format = bulk_import_format(upload)
+        if upload_format is None:
+            return handle_validation_error('Upload a CSV or JSON lines file')
+        
+        # One read each for the category and supplier lookups
+        categories = {}
+        category_refs = {}
+        for doc in db.collection('categories').select(['name']).stream():
+            name = doc.to_dict().get('name')
+            if name:
+                categories[doc.id] = name
+                categories[name.lower()] = name
+                category_refs[name] = doc.reference
+        suppliers = {}
+        for doc in db.collection('suppliers').select(['name']).stream():
+            name = doc.to_dict().get('name')
+            if name:
+                suppliers[name.lower()] = name
+        
+        writer = BulkInventoryWriter(category_refs)
+        chunk = []
+        rows = 0
+        number = 0
+        try:
+            for number, row in read_bulk_rows(upload.stream if upload is not None else request.stream, upload_format):
+                rows += 1
+                if rows > BULK_IMPORT_MAX_ROWS:
+                    writer.errors.append({'row': number, 'error': f'Upload is limited to {BULK_IMPORT_MAX_ROWS} rows; the rest was not read'})
+                    break
+                try:
+                    chunk.append((number, validate_bulk_row(row, categories, suppliers)))
+                except ValueError as e:
+                    writer.errors.append({'row': number, 'error': str(e)})
+                if len(chunk) == BULK_IMPORT_CHUNK_ROWS:
+                    writer.write_chunk(chunk)
+                    chunk = []
+        except (UnicodeDecodeError, csv.Error) as e:
+            # Keep what was read so far; the rows already committed stay committed
+            writer.errors.append({'row': number + 1, 'error': f'Could not read the upload: {e}; the rest was not read'})
+        if chunk:
+            writer.write_chunk(chunk)
+        writer.flush()
+        
+        writer.errors.sort(key=lambda error: error['row'])
+        return jsonify({
+            'success': True,
+            'created': writer.created,
+            'updated': writer.updated,
+            'failed': len(writer.errors),
+            'errors': writer.errors
+        })
+    except Exception as e:
+        return handle_database_error(e, "importing inventory")
+
 # Supplier Management Routes
 @app.route('/api/suppliers', methods=['GET', 'POST'])
 @validate_session
@@ -829,6 +2221,17 @@ def api_suppliers():
             suppliers = []
             for doc in suppliers_ref.stream():
                 suppliers.append({'id': doc.id, **doc.to_dict()})
+            
+            # Stock totals come from the inventory mirror's per-supplier index
+            try:
+                summaries = inventory_mirror.supplier_summaries(supplier.get('name', '') for supplier in suppliers)
+            except RuntimeError as e:
+                # The supplier list does not need the mirror; leave the totals out
+                logger.warning(f"Supplier totals unavailable: {e}")
+                summaries = {}
+            for supplier in suppliers:
+                if supplier.get('name', '') in summaries:
+                    supplier['summary'] = summaries[supplier.get('name', '')]
             return jsonify({'success': True, 'suppliers': suppliers})
         else:
             data = request.get_json()
@@ -888,19 +2291,11 @@ def api_categories():
             categories_ref = db.collection('categories')
             categories = []
             
-            # Get all categories
+            # item_count is maintained by the inventory writes
             for doc in categories_ref.stream():
-                category_data = {'id': doc.id, **doc.to_dict()}
+                category_data = {'id': doc.id, 'item_count': 0, **doc.to_dict()}
                 categories.append(category_data)
             
-            # Get item counts for each category
-            inventory_ref = db.collection('inventory')
-            for category in categories:
-                # Count items in this category
-                items_in_category = inventory_ref.where('category', '==', category['name']).stream()
-                item_count = sum(1 for _ in items_in_category)
-                category['item_count'] = item_count
-            
             return jsonify({'success': True, 'categories': categories})
         else:
             data = request.get_json()
@@ -912,6 +2307,8 @@ def api_categories():
                 if isinstance(data[key], str):
                     data[key] = sanitize_input(data[key])
             
+            # Items may already name this category
+            data['item_count'] = count_category_items(data['name']) if data.get('name') else 0
             doc_ref = db.collection('categories').add(data)
             return jsonify({'success': True, 'message': 'Category created successfully', 'category_id': doc_ref[1].id})
     except Exception as e:
@@ -928,12 +2325,7 @@ def manage_category(category_id):
             if category.exists:
                 category_data = category.to_dict()
                 category_data['id'] = category_id
-                
-                # Get item count for this category
-                inventory_ref = db.collection('inventory')
-                items_in_category = inventory_ref.where('category', '==', category_data['name']).stream()
-                item_count = sum(1 for _ in items_in_category)
-                category_data['item_count'] = item_count
+                category_data.setdefault('item_count', 0)
                 
                 return jsonify({'success': True, 'category': category_data})
             return handle_not_found_error('Category')
@@ -948,6 +2340,10 @@ def manage_category(category_id):
                 if isinstance(data[key], str):
                     data[key] = sanitize_input(data[key])
             
+            # The counter follows inventory writes; a rename recounts under the new name
+            data.pop('item_count', None)
+            if data.get('name'):
+                data['item_count'] = count_category_items(data['name'])
             db.collection('categories').document(category_id).update(data)
             return jsonify({'success': True, 'message': 'Category updated successfully'})
         
@@ -1006,10 +2402,12 @@ def manage_account(account_id):
                     data[key] = sanitize_input(data[key])
             
             db.collection('users').document(account_id).update(data)
+            staff_directory.invalidate(account_id)
             return jsonify({'success': True, 'message': 'Account updated successfully'})
         
         elif request.method == 'DELETE':
             db.collection('users').document(account_id).delete()
+            staff_directory.invalidate(account_id)
             return jsonify({'success': True, 'message': 'Account deleted successfully'})
     
     except Exception as e:
@@ -1067,10 +2465,12 @@ def manage_user(user_id):
                     data[key] = sanitize_input(data[key])
             
             db.collection('users').document(user_id).update(data)
+            staff_directory.invalidate(user_id)
             return jsonify({'success': True, 'message': 'User updated successfully'})
         
         elif request.method == 'DELETE':
             db.collection('users').document(user_id).delete()
+            staff_directory.invalidate(user_id)
             return jsonify({'success': True, 'message': 'User deleted successfully'})
     
     except Exception as e:
@@ -1144,6 +2544,7 @@ def create_staff_account():
             })
             
             if doc_ref:
+                staff_directory.invalidate(doc_ref[1].id)
                 flash(f'Staff account created successfully for {full_name} ({username}) as {role}!', 'success')
                 logger.info(f"Admin {current_user.username} created staff account: {username}")
                 return redirect(url_for('dashboard'))
@@ -1181,6 +2582,36 @@ def inject_flash_categories():
     """Inject flash message categories into templates."""
     return dict(flash_categories=['success', 'error', 'info', 'warning'])
 
+@firestore.transactional
+def create_sale_in_transaction(transaction, sale_ref, sale_data, quantities, item_names, stock_after):
+    """Check stock, decrement it and write a sale with its aggregates, all or nothing.
+    
+    Stock for every item is read with one batched get inside the transaction,
+    so a concurrent checkout of the same items makes Firestore retry this one
+    against the new stock instead of overselling. Returns None on success, or
+    the message explaining why the sale was refused (nothing is written).
+    ``stock_after`` is filled with each item's stock once the sale commits.
+    """
+    inventory_ref = db.collection('inventory')
+    refs = [inventory_ref.document(item_id) for item_id in quantities]
+    snapshots = {snapshot.id: snapshot for snapshot in transaction.get_all(refs)}
+    
+    for item_id, quantity in quantities.items():
+        snapshot = snapshots.get(item_id)
+        if snapshot is None or not snapshot.exists:
+            return f'Item {item_names.get(item_id, "Unknown")} not found'
+        inventory_item = snapshot.to_dict()
+        current_stock = inventory_item.get('stock', 0)
+        if current_stock < quantity:
+            return f'Insufficient stock for {inventory_item.get("name", item_names.get(item_id, "Unknown"))}. Available: {current_stock}, Requested: {quantity}'
+    
+    for item_id, quantity in quantities.items():
+        transaction.update(inventory_ref.document(item_id), {'stock': firestore.Increment(-quantity)})
+        stock_after[item_id] = snapshots[item_id].to_dict().get('stock', 0) - quantity
+    transaction.set(sale_ref, sale_data)
+    record_sale_change(transaction, new_sale=sale_data)
+    return None
+
 def create_sale():
     """Create a new sale with enhanced validation and error handling."""
     if 'user_id' not in session:
@@ -1206,55 +2637,41 @@ def create_sale():
         except (ValueError, TypeError):
             return handle_validation_error('Invalid total amount')
         
-        # Validate items and check stock
+        # Validate items; the same item may appear on several cart lines
+        quantities = {}
+        item_names = {}
         for item in items:
             item_id = item.get('id')
             quantity = item.get('quantity', 0)
             
-            if not item_id or quantity <= 0:
+            if not item_id or not isinstance(quantity, (int, float)) or quantity <= 0:
                 return handle_validation_error('Invalid item data')
-            
-            try:
-                doc = db.collection('inventory').document(item_id).get()
-                if not doc.exists:
-                    return handle_validation_error(f'Item {item.get("name", "Unknown")} not found')
-                
-                inventory_item = {'id': doc.id, **doc.to_dict()}
-                current_stock = inventory_item.get('stock', 0)
-                
-                if current_stock < quantity:
-                    return handle_validation_error(f'Insufficient stock for {inventory_item["name"]}. Available: {current_stock}, Requested: {quantity}')
-            except Exception as e:
-                logger.error(f"Error checking inventory for item {item_id}: {e}")
-                return handle_validation_error('Error checking inventory')
+            quantities[item_id] = quantities.get(item_id, 0) + quantity
+            item_names[item_id] = item.get('name', 'Unknown')
         
         # Create sale record
         sale_id = str(uuid.uuid4())
+        sale_date = datetime.now()
         sale_data = {
             'id': sale_id,
             'customer_name': customer_name,
             'items': items,
             'total': total,
-            'date': datetime.now().isoformat(),
+            'date': sale_date.isoformat(),
+            **sale_date_fields(sale_date),
             'staff_id': session['user_id']
         }
         
-        db.collection('sales').document(sale_id).set(sale_data)
-        
-        # Update inventory stock
-        for item in items:
-            item_id = item.get('id')
-            quantity = item.get('quantity', 0)
-            
-            try:
-                doc = db.collection('inventory').document(item_id).get()
-                if doc.exists:
-                    current_stock = doc.to_dict().get('stock', 0)
-                    new_stock = current_stock - quantity
-                    db.collection('inventory').document(item_id).update({'stock': new_stock})
-            except Exception as e:
-                logger.error(f"Error updating inventory for item {item_id}: {e}")
-                # Continue with other items even if one fails
+        # Check and decrement stock, write the sale and its aggregates in one transaction
+        stock_after = {}
+        transaction = db.transaction()
+        error = create_sale_in_transaction(transaction, db.collection('sales').document(sale_id), sale_data, quantities, item_names, stock_after)
+        if error:
+            return handle_validation_error(error)
+        recent_sales.add(sale_data)
+        customer_search.apply_sale(new_sale=sale_data)
+        inventory_mirror.apply_stock_levels(stock_after, transaction.commit_time)
+        sales_engine.add(sale_id, sale_data, sale_date)
         
         logger.info(f"Sale created successfully: {sale_id} by {session.get('username', 'Unknown')}")
         return jsonify({'success': True, 'message': 'Sale completed successfully', 'sale_id': sale_id})
@@ -1264,101 +2681,317 @@ def create_sale():
         return handle_database_error(e, "creating sale")
 
 # Customer Profile Management Routes
+IMAGE_MAX_AGE = 365 * 24 * 3600  # stored images never change, see ImageStore
+
+def profile_picture_url(reference, variant='medium', allow_inline=True):
+    """Return the URL of a stored profile picture thumbnail.
+    
+    Profiles saved before the image store keep an inline data URL; it is passed
+    through for single-profile views but left out of lists (``allow_inline``).
+    """
+    if not reference:
+        return None
+    if reference.startswith('data:'):
+        return reference if allow_inline else None
+    return url_for('serve_image', name=ImageStore.variant(reference, variant))
+
+@app.route('/media/images/<name>')
+@login_required
+def serve_image(name):
+    """Serve a stored image or thumbnail with a long-lived cache lifetime."""
+    path = image_store.path(name)
+    if not path or not os.path.exists(path):
+        return handle_not_found_error('Image')
+    response = send_file(path, etag=ImageStore.etag(name), max_age=IMAGE_MAX_AGE)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+def customer_profile_ref(customer_name):
+    """Return the customers document reference for a name (keyed like customer_stats)."""
+    return db.collection('customers').document(customer_doc_id(customer_name))
+
+def find_customer_profile(customer_name, fields=None):
+    """Return the profile snapshot for a customer name, or None if there is no profile.
+    
+    Profiles are read with a single get by customer_doc_id. A profile saved
+    under a random id by older versions is found by name once and moved to
+    its keyed id; `flask migrate-customer-profiles` moves them all up front.
+    """
+    snapshot = customer_profile_ref(customer_name).get(field_paths=fields)
+    if snapshot.exists:
+        return snapshot
+    legacy = list(db.collection('customers').where('name', '==', customer_name).limit(1).stream())
+    if not legacy:
+        return None
+    rekey_customer_profile(legacy[0])
+    return customer_profile_ref(customer_name).get(field_paths=fields)
+
+def rekey_customer_profile(doc):
+    """Move a profile document to the id derived from its name."""
+    profile = doc.to_dict()
+    target_ref = customer_profile_ref(profile['name'])
+    if doc.id == target_ref.id:
+        return target_ref
+    batch = db.batch()
+    batch.set(target_ref, profile, merge=True)
+    batch.delete(doc.reference)
+    batch.commit()
+    return target_ref
+
+# Customer search
+CUSTOMER_SEARCH_MAX_AGE = 600  # seconds; a reload reads every customer's stats and profile, and other workers' new customers wait for it
+CUSTOMER_SEARCH_LIMIT = 10
+CUSTOMER_SEARCH_MAX_LIMIT = 50
+CUSTOMER_SEARCH_SCAN_LIMIT = 512  # past this many prefix matches, walk customers by spend instead
+
+class CustomerSearchIndex:
+    """Process-wide prefix index over customer names, phone numbers and emails.
+    
+    Search keys are kept in a sorted list of (key, customer name) pairs, so a
+    prefix lookup is two bisects plus a walk over the matching run. Matches
+    are ranked by total spent; when a short prefix matches a large run, the
+    customers are walked in spend order instead until enough of them match.
+    The index is loaded from customer_stats and the customer profiles,
+    updated in place by this process's sale and profile writes, and reloaded
+    after ``max_age`` seconds.
+    """
+    
+    def __init__(self, max_age=CUSTOMER_SEARCH_MAX_AGE):
+        self.max_age = max_age
+        self._keys = []
+        self._by_spend = []
+        self._customers = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def search_keys(customer):
+        """Return the keys a customer is found by: the name from each word on, phone digits and email."""
+        words = customer['name'].lower().split()
+        keys = {' '.join(words[i:]) for i in range(len(words))}
+        phone = re.sub(r'\D', '', customer.get('phone') or '')
+        if phone:
+            keys.add(phone)
+        if customer.get('email'):
+            keys.add(customer['email'].strip().lower())
+        return keys
+    
+    @staticmethod
+    def _discard(entries, entry):
+        index = bisect.bisect_left(entries, entry)
+        if index < len(entries) and entries[index] == entry:
+            del entries[index]
+    
+    def _put(self, name, **fields):
+        customer = self._customers.get(name)
+        if customer is not None:
+            for key in customer['keys']:
+                self._discard(self._keys, (key, name))
+            self._discard(self._by_spend, (-customer['total_spent'], name))
+        customer = {'name': name, 'total_spent': 0.0, 'phone': None, 'email': None, **(customer or {}), **fields}
+        customer['keys'] = self.search_keys(customer)
+        for key in customer['keys']:
+            bisect.insort(self._keys, (key, name))
+        bisect.insort(self._by_spend, (-customer['total_spent'], name))
+        self._customers[name] = customer
+    
+    def _load(self):
+        customers = {}
+        for doc in db.collection('customer_stats').select(['name', 'total_spent']).stream():
+            stats = doc.to_dict()
+            if stats.get('name'):
+                customers[stats['name']] = {'name': stats['name'], 'total_spent': float(stats.get('total_spent', 0)), 'phone': None, 'email': None}
+        for doc in db.collection('customers').select(['name', 'phone', 'email']).stream():
+            profile = doc.to_dict()
+            if profile.get('name'):
+                customer = customers.setdefault(profile['name'], {'name': profile['name'], 'total_spent': 0.0})
+                customer.update(phone=profile.get('phone'), email=profile.get('email'))
+        
+        keys = []
+        for customer in customers.values():
+            customer['keys'] = self.search_keys(customer)
+            keys.extend((key, customer['name']) for key in customer['keys'])
+        keys.sort()
+        self._keys = keys
+        self._by_spend = sorted((-customer['total_spent'], customer['name']) for customer in customers.values())
+        self._customers = customers
+        self._loaded_at = time.monotonic()
+    
+    def search(self, query, limit=CUSTOMER_SEARCH_LIMIT):
+        """Return up to ``limit`` customers with a key starting with ``query``, biggest spenders first.
+        
+        A customer whose whole name is the query comes first whatever they
+        spent, so an exact-name lookup always finds them.
+        """
+        prefix = ' '.join(query.lower().split())
+        if re.fullmatch(r'[\d\s()+.-]+', prefix) and re.search(r'\d', prefix):
+            prefix = re.sub(r'\D', '', prefix)
+        if not prefix:
+            return []
+        
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.max_age:
+                self._load()
+            start = bisect.bisect_left(self._keys, (prefix, ''))
+            end = bisect.bisect_left(self._keys, (prefix + chr(0x10FFFF), ''))
+            if end - start <= CUSTOMER_SEARCH_SCAN_LIMIT:
+                names = {name for _, name in self._keys[start:end]}
+                matches = heapq.nsmallest(limit, names, key=lambda name: (-self._customers[name]['total_spent'], name))
+            else:
+                matches = []
+                for _, name in self._by_spend:
+                    if any(key.startswith(prefix) for key in self._customers[name]['keys']):
+                        matches.append(name)
+                        if len(matches) == limit:
+                            break
+            exact_end = bisect.bisect_right(self._keys, (prefix, chr(0x10FFFF)))
+            exact = [name for _, name in self._keys[start:exact_end] if ' '.join(name.lower().split()) == prefix]
+            matches = (exact + [name for name in matches if name not in exact])[:limit]
+            return [
+                {field: self._customers[name][field] for field in ('name', 'total_spent', 'phone', 'email')}
+                for name in matches
+            ]
+    
+    def apply_sale(self, old_sale=None, new_sale=None):
+        """Move customers' total spent by a sale create, edit or delete."""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for sale, sign in ((old_sale, -1), (new_sale, 1)):
+                if sale:
+                    name = sale.get('customer_name', 'Walk-in Customer')
+                    spent = self._customers.get(name, {}).get('total_spent', 0.0)
+                    self._put(name, total_spent=spent + sign * float(sale.get('total', 0) or 0))
+    
+    def update_profile(self, name, phone=None, email=None, previous_name=None):
+        """Re-index a customer's contact details after a profile save or rename."""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            if previous_name and previous_name != name and previous_name in self._customers:
+                self._put(previous_name, phone=None, email=None)
+            self._put(name, phone=phone, email=email)
+
+customer_search = CustomerSearchIndex()
+
+@app.route('/api/customers/search', methods=['GET'])
+@validate_session
+def search_customers():
+    """Autocomplete customers by name, phone or email prefix, ranked by total spent."""
+    try:
+        limit = parse_page_limit(request.args.get('limit'), CUSTOMER_SEARCH_LIMIT, CUSTOMER_SEARCH_MAX_LIMIT)
+        return jsonify({'success': True, 'customers': customer_search.search(request.args.get('q', ''), limit)})
+    except Exception as e:
+        return handle_database_error(e, "searching customers")
+
+# Customer list: sort name -> (customer_stats field, descending)
+CUSTOMER_SORTS = {
+    'total_spent': ('total_spent', True),
+    'total_sales': ('total_sales', True),
+    'last_purchase': ('last_purchase_epoch', True),
+    'name': ('name', False)
+}
+
+# Output field -> customer_stats field it is built from
+CUSTOMER_STATS_FIELDS = {
+    'name': 'name',
+    'total_sales': 'total_sales',
+    'total_spent': 'total_spent',
+    'first_purchase': 'first_purchase_epoch',
+    'last_purchase': 'last_purchase_epoch',
+    'purchase_count': 'total_sales',
+    'favorite_items': 'favorite_items',
+    'favorite_categories': 'favorite_categories'
+}
+CUSTOMER_PROFILE_FIELDS = ('age', 'sex', 'address', 'occupation', 'business', 'phone', 'email', 'notes', 'profile_picture')
+CUSTOMER_PROFILE_DEFAULTS = {'age': 'N/A', 'sex': 'N/A', 'address': 'N/A', 'occupation': 'N/A', 'business': 'N/A'}
+
+def customer_list_entry(stats, fields):
+    """Build the requested output fields of one customer from its customer_stats document."""
+    first_epoch = stats.get('first_purchase_epoch')
+    last_epoch = stats.get('last_purchase_epoch')
+    entry = {
+        'name': stats.get('name'),
+        'total_sales': stats.get('total_sales', 0),
+        'total_spent': float(stats.get('total_spent', 0)),
+        'first_purchase': datetime.fromtimestamp(first_epoch) if first_epoch is not None else None,
+        'last_purchase': datetime.fromtimestamp(last_epoch) if last_epoch is not None else None,
+        'purchase_count': stats.get('total_sales', 0),
+        'favorite_items': {name: count for name, count in stats.get('favorite_items', {}).items() if count > 0},
+        'favorite_categories': {name: count for name, count in stats.get('favorite_categories', {}).items() if count > 0}
+    }
+    return {field: value for field, value in entry.items() if field in fields}
+
 @app.route('/api/customers', methods=['GET'])
 @validate_session
 def get_customers():
-    """Get customer list with statistics."""
+    """Get customer list with statistics.
+    
+    ``limit`` and ``cursor`` page through customer_stats in ``sort`` order
+    (total_spent, total_sales, last_purchase or name) with keyset_page; ``fields`` is a
+    comma-separated list of the fields to return. Without ``limit`` or
+    ``cursor`` every customer is returned, biggest spenders first.
+    """
     try:
-        # Get all unique customers from sales
-        sales_ref = db.collection('sales')
-        customers = {}
+        sort = request.args.get('sort', 'total_spent')
+        if sort not in CUSTOMER_SORTS:
+            return handle_validation_error(f'Unknown sort: {sort}')
+        order_field, descending = CUSTOMER_SORTS[sort]
+        
+        available = set(CUSTOMER_STATS_FIELDS) | set(CUSTOMER_PROFILE_FIELDS)
+        requested = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+        unknown = [field for field in requested if field not in available]
+        if unknown:
+            return handle_validation_error(f"Unknown fields: {', '.join(unknown)}")
+        fields = set(requested or available) | {'name'}
+        
+        # Read only the stats fields the response needs
+        stats_fields = {CUSTOMER_STATS_FIELDS[field] for field in fields if field in CUSTOMER_STATS_FIELDS}
+        stats_query = db.collection('customer_stats').select(sorted(stats_fields | {'total_sales', order_field}))
+        
+        paged = 'limit' in request.args or 'cursor' in request.args
+        response = {'success': True}
+        if paged:
+            limit = parse_page_limit(request.args.get('limit'))
+            try:
+                docs, next_cursor, prev_cursor = keyset_page(stats_query, order_field, request.args.get('cursor', ''), limit, descending=descending)
+            except ValueError:
+                return handle_validation_error('Invalid cursor')
+            response.update({'limit': limit, 'sort': sort, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor})
+        else:
+            direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+            docs = stats_query.order_by(order_field, direction=direction).stream()
         
-        for doc in sales_ref.stream():
-            sale = doc.to_dict()
-            customer_name = sale.get('customer_name', 'Walk-in Customer')
-            
-            if customer_name not in customers:
-                customers[customer_name] = {
-                    'name': customer_name,
-                    'total_sales': 0,
-                    'total_spent': 0.0,
-                    'first_purchase': None,
-                    'last_purchase': None,
-                    'purchase_count': 0,
-                    'favorite_items': {},
-                    'favorite_categories': {}
-                }
-            
-            # Update customer statistics
-            customers[customer_name]['total_sales'] += 1
-            customers[customer_name]['total_spent'] += float(sale.get('total', 0))
-            
-            # Track purchase dates
-            sale_date = sale.get('date')
-            if sale_date:
-                try:
-                    dt = datetime.fromisoformat(sale_date)
-                    if not customers[customer_name]['first_purchase'] or dt < customers[customer_name]['first_purchase']:
-                        customers[customer_name]['first_purchase'] = dt
-                    if not customers[customer_name]['last_purchase'] or dt > customers[customer_name]['last_purchase']:
-                        customers[customer_name]['last_purchase'] = dt
-                except (ValueError, TypeError):
+        customers = {}
+        for doc in docs:
+            stats = doc.to_dict()
+            if stats.get('name') and stats.get('total_sales', 0) > 0:
+                customers[stats['name']] = customer_list_entry(stats, fields)
+        
+        # Profile fields come from one batched read of the keyed profiles on this page
+        profile_fields = [field for field in CUSTOMER_PROFILE_FIELDS if field in fields]
+        if profile_fields and customers:
+            profile_refs = [customer_profile_ref(name) for name in customers]
+            for doc in db.get_all(profile_refs, field_paths=profile_fields + ['name']):
+                if not doc.exists:
                     continue
-            
-            # Track favorite items and categories
-            items = sale.get('items', [])
-            for item in items:
-                item_name = item.get('name', '')
-                item_category = item.get('category', '')
-                quantity = item.get('quantity', 1)
-                
-                if item_name:
-                    if item_name not in customers[customer_name]['favorite_items']:
-                        customers[customer_name]['favorite_items'][item_name] = 0
-                    customers[customer_name]['favorite_items'][item_name] += quantity
-                
-                if item_category:
-                    if item_category not in customers[customer_name]['favorite_categories']:
-                        customers[customer_name]['favorite_categories'][item_category] = 0
-                    customers[customer_name]['favorite_categories'][item_category] += quantity
-        
-        # Get additional profile information from customers collection
-        customers_ref = db.collection('customers')
-        for doc in customers_ref.stream():
-            profile_data = doc.to_dict()
-            customer_name = profile_data.get('name')
-            if customer_name in customers:
-                # Merge profile data with sales data
-                customers[customer_name].update({
-                    'age': profile_data.get('age', 'N/A'),
-                    'sex': profile_data.get('sex', 'N/A'),
-                    'address': profile_data.get('address', 'N/A'),
-                    'occupation': profile_data.get('occupation', 'N/A'),
-                    'business': profile_data.get('business', 'N/A'),
-                    'phone': profile_data.get('phone'),
-                    'email': profile_data.get('email'),
-                    'notes': profile_data.get('notes'),
-                    'profile_picture': profile_data.get('profile_picture')
-                })
+                profile_data = doc.to_dict()
+                customer = customers.get(profile_data.get('name'))
+                if customer is None:
+                    continue
+                for field in profile_fields:
+                    if field == 'profile_picture':
+                        customer[field] = profile_picture_url(profile_data.get(field), 'thumb', allow_inline=False)
+                    else:
+                        customer[field] = profile_data.get(field, CUSTOMER_PROFILE_DEFAULTS.get(field))
+            for customer in customers.values():
+                for field in profile_fields:
+                    customer.setdefault(field, CUSTOMER_PROFILE_DEFAULTS.get(field))
         
-        # Ensure all customers have age, sex, address, occupation, business fields
-        for c in customers.values():
-            if 'age' not in c:
-                c['age'] = 'N/A'
-            if 'sex' not in c:
-                c['sex'] = 'N/A'
-            if 'address' not in c:
-                c['address'] = 'N/A'
-            if 'occupation' not in c:
-                c['occupation'] = 'N/A'
-            if 'business' not in c:
-                c['business'] = 'N/A'
-        
-        # Convert to list and sort by total spent
-        customers_list = list(customers.values())
-        customers_list.sort(key=lambda x: x['total_spent'], reverse=True)
-        
-        return jsonify({'success': True, 'customers': customers_list})
+        response['customers'] = list(customers.values())
+        return jsonify(response)
         
     except Exception as e:
         return handle_database_error(e, "fetching customers")
@@ -1371,56 +3004,52 @@ def get_customer_profile(customer_name):
         # Decode the customer name from URL
         customer_name = unquote(customer_name)
         
-        # Get all sales for this customer
-        sales_ref = db.collection('sales')
+        # Get all sales for this customer through the customer_name index
         customer_sales = []
         total_spent = 0.0
         total_items = 0
         favorite_items = {}
         favorite_categories = {}
         purchase_dates = []
+        dated_sales = []
         
-        for doc in sales_ref.stream():
+        for doc in customer_sales_query(customer_name).stream():
             sale = doc.to_dict()
-            if sale.get('customer_name') == customer_name:
-                sale_data = {
-                    'id': doc.id,
-                    'date': sale.get('date'),
-                    'total': sale.get('total', 0),
-                    'items': sale.get('items', []),
-                    'staff_id': sale.get('staff_id')
-                }
-                customer_sales.append(sale_data)
-                
-                # Calculate statistics
-                total_spent += float(sale.get('total', 0))
+            sale_data = {
+                'id': doc.id,
+                'date': sale.get('date'),
+                'total': sale.get('total', 0),
+                'items': sale.get('items', []),
+                'staff_id': sale.get('staff_id')
+            }
+            customer_sales.append(sale_data)
+            
+            # Calculate statistics
+            total_spent += float(sale.get('total', 0))
+            
+            # Track items and categories
+            items = sale.get('items', [])
+            for item in items:
+                item_name = item.get('name', '')
+                item_category = item.get('category', '')
+                quantity = item.get('quantity', 1)
+                total_items += quantity
                 
-                # Track items and categories
-                items = sale.get('items', [])
-                for item in items:
-                    item_name = item.get('name', '')
-                    item_category = item.get('category', '')
-                    quantity = item.get('quantity', 1)
-                    total_items += quantity
-                    
-                    if item_name:
-                        if item_name not in favorite_items:
-                            favorite_items[item_name] = 0
-                        favorite_items[item_name] += quantity
-                    
-                    if item_category:
-                        if item_category not in favorite_categories:
-                            favorite_categories[item_category] = 0
-                        favorite_categories[item_category] += quantity
+                if item_name:
+                    if item_name not in favorite_items:
+                        favorite_items[item_name] = 0
+                    favorite_items[item_name] += quantity
                 
-                # Track purchase dates
-                sale_date = sale.get('date')
-                if sale_date:
-                    try:
-                        dt = datetime.fromisoformat(sale_date)
-                        purchase_dates.append(dt)
-                    except (ValueError, TypeError):
-                        continue
+                if item_category:
+                    if item_category not in favorite_categories:
+                        favorite_categories[item_category] = 0
+                    favorite_categories[item_category] += quantity
+            
+            # Track purchase dates
+            dt = sale_datetime(sale)
+            if dt:
+                purchase_dates.append(dt)
+                dated_sales.append((dt, sale_data))
         
         # Sort sales by date (newest first)
         customer_sales.sort(key=lambda x: x.get('date', ''), reverse=True)
@@ -1438,16 +3067,12 @@ def get_customer_profile(customer_name):
         monthly_spending = {}
         six_months_ago = datetime.now() - timedelta(days=180)
         
-        for sale in customer_sales:
-            try:
-                sale_date = datetime.fromisoformat(sale.get('date', ''))
-                if sale_date >= six_months_ago:
-                    month_key = sale_date.strftime('%Y-%m')
-                    if month_key not in monthly_spending:
-                        monthly_spending[month_key] = 0
-                    monthly_spending[month_key] += float(sale.get('total', 0))
-            except (ValueError, TypeError):
-                continue
+        for sale_date, sale in dated_sales:
+            if sale_date >= six_months_ago:
+                month_key = sale_date.strftime('%Y-%m')
+                if month_key not in monthly_spending:
+                    monthly_spending[month_key] = 0
+                monthly_spending[month_key] += float(sale.get('total', 0))
         
         # Format monthly spending data
         monthly_data = []
@@ -1458,13 +3083,8 @@ def get_customer_profile(customer_name):
             })
         
         # Get additional profile information
-        customers_ref = db.collection('customers')
-        profile_data = {}
-        for doc in customers_ref.stream():
-            data = doc.to_dict()
-            if data.get('name') == customer_name:
-                profile_data = data
-                break
+        profile_doc = find_customer_profile(customer_name)
+        profile_data = profile_doc.to_dict() if profile_doc else {}
         
         customer_profile = {
             'name': customer_name,
@@ -1487,7 +3107,7 @@ def get_customer_profile(customer_name):
             'phone': profile_data.get('phone'),
             'email': profile_data.get('email'),
             'notes': profile_data.get('notes'),
-            'profile_picture': profile_data.get('profile_picture')
+            'profile_picture': profile_picture_url(profile_data.get('profile_picture'))
         }
         
         return jsonify({'success': True, 'customer': customer_profile})
@@ -1532,9 +3152,10 @@ def update_customer_profile():
             if file and file.filename:
                 allowed_extensions = {'png', 'jpg', 'jpeg', 'gif'}
                 if '.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in allowed_extensions:
-                    file_content = file.read()
-                    file_extension = file.filename.rsplit('.', 1)[1].lower()
-                    profile_picture = f"data:image/{file_extension};base64,{base64.b64encode(file_content).decode('utf-8')}"
+                    try:
+                        profile_picture = image_store.save(file.read())
+                    except ValueError as e:
+                        return jsonify({'success': False, 'error': str(e)}), 400
 
         # Prepare customer data
         customer_data = {
@@ -1550,20 +3171,30 @@ def update_customer_profile():
         if profile_picture:
             customer_data['profile_picture'] = profile_picture
 
-        # Check if customer profile already exists (by original_name if provided, else by name)
-        customers_ref = db.collection('customers')
-        existing_doc = None
-        search_name = original_name or customer_name
-        for doc in customers_ref.stream():
-            if doc.to_dict().get('name') == search_name:
-                existing_doc = doc
-                break
-
-        if existing_doc:
-            existing_doc.reference.update(customer_data)
+        # Look up the existing profile (by original_name if provided, else by name)
+        existing_doc = find_customer_profile(original_name or customer_name)
+        target_ref = customer_profile_ref(customer_data['name'])
+
+        if existing_doc and existing_doc.id == target_ref.id:
+            target_ref.update(customer_data)
+        elif existing_doc:
+            # Renamed: move the profile to the id keyed by its new name, unless that name has a profile already
+            if find_customer_profile(customer_data['name'], ['name']):
+                return jsonify({'success': False, 'error': 'A customer with this name already exists'}), 409
+            batch = db.batch()
+            # create fails the batch if another request took the name in the meantime
+            batch.create(target_ref, {**existing_doc.to_dict(), **customer_data})
+            batch.delete(existing_doc.reference)
+            batch.commit()
         else:
             customer_data['created_at'] = datetime.now().isoformat()
-            customers_ref.add(customer_data)
+            target_ref.set(customer_data)
+
+        saved_profile = {**existing_doc.to_dict(), **customer_data} if existing_doc else customer_data
+        customer_search.update_profile(
+            customer_data['name'], saved_profile.get('phone'), saved_profile.get('email'),
+            previous_name=existing_doc.to_dict().get('name') if existing_doc else None
+        )
 
         return jsonify({'success': True, 'message': 'Customer profile updated successfully'})
     except Exception as e:
@@ -1576,27 +3207,72 @@ def get_customer_purchase_history(customer_name):
     """Return all purchase history for a specific customer, sorted by date descending."""
     try:
         customer_name = unquote(customer_name)
-        sales_ref = db.collection('sales')
-        purchases = []
-        for doc in sales_ref.stream():
+        dated_purchases = []
+        for doc in customer_sales_query(customer_name, ['date', SALE_DATE_FIELD, 'total', 'items']).stream():
             sale = doc.to_dict()
-            if sale.get('customer_name') == customer_name:
-                purchases.append({
-                    'date': sale.get('date'),
-                    'total': float(sale.get('total', 0)),
-                    'items': sale.get('items', [])
-                })
+            dated_purchases.append((sale_datetime(sale) or datetime.min, {
+                'date': sale.get('date'),
+                'total': float(sale.get('total', 0)),
+                'items': sale.get('items', [])
+            }))
         # Sort by date descending
-        def parse_date(s):
-            try:
-                return datetime.fromisoformat(s)
-            except Exception:
-                return datetime.min
-        purchases.sort(key=lambda x: parse_date(x['date']), reverse=True)
+        dated_purchases.sort(key=lambda x: x[0], reverse=True)
+        purchases = [purchase for _, purchase in dated_purchases]
         return jsonify({'success': True, 'purchases': purchases})
     except Exception as e:
         return handle_database_error(e, "fetching customer purchase history")
 
+@app.route('/api/customers/<path:customer_name>/sales', methods=['GET'])
+@validate_session
+@staff_required
+def get_customer_sales(customer_name):
+    """Return one page of a customer's sales, newest first.
+    
+    Pages come from keyset_page over customer_sales_query, so a page costs
+    ``limit`` reads however long the customer's history is. ``page`` is
+    accepted for callers that do not pass cursors yet.
+    """
+    try:
+        customer_name = unquote(customer_name)
+        try:
+            page = parse_page_number(request.args.get('page'))
+        except ValueError:
+            return handle_validation_error('Invalid page number')
+        limit = parse_page_limit(request.args.get('limit'))
+        cursor = request.args.get('cursor', '')
+        
+        try:
+            offset = 0 if cursor else (page - 1) * limit
+            docs, next_cursor, prev_cursor = keyset_page(customer_sales_query(customer_name), SALE_DATE_FIELD, cursor, limit, offset=offset)
+        except ValueError:
+            return handle_validation_error('Invalid cursor')
+        
+        sales = [{'id': doc.id, **doc.to_dict()} for doc in docs]
+        users_map = staff_names_for(sales)
+        sales = [format_sale_for_display(sale, users_map) for sale in sales]
+        
+        response = {
+            'success': True,
+            'sales': sales,
+            'limit': limit,
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor
+        }
+        
+        # The sale count comes from the customer's stats document, not a count query
+        if not cursor:
+            stats = db.collection('customer_stats').document(customer_doc_id(customer_name)).get(field_paths=['total_sales'])
+            total = int(stats.to_dict().get('total_sales', 0)) if stats.exists else 0
+            response.update({
+                'total': total,
+                'page': page,
+                'total_pages': (total + limit - 1) // limit
+            })
+        
+        return jsonify(response)
+    except Exception as e:
+        return handle_database_error(e, "fetching customer sales")
+
 @app.route('/customer_profile')
 @staff_required
 def customer_profile():
@@ -1609,44 +3285,7 @@ def get_customer_summary(customer_name):
     """Return summary info for a specific customer: first purchase, recent purchase, current month spending, and month with most spending."""
     try:
         customer_name = unquote(customer_name)
-        sales_ref = db.collection('sales')
-        purchase_dates = []
-        monthly_spending = {}
-        current_month = datetime.now().strftime('%Y-%m')
-        current_month_spending = 0.0
-        for doc in sales_ref.stream():
-            sale = doc.to_dict()
-            if sale.get('customer_name') == customer_name:
-                sale_date = sale.get('date')
-                total = float(sale.get('total', 0))
-                if sale_date:
-                    try:
-                        dt = datetime.fromisoformat(sale_date)
-                        purchase_dates.append(dt)
-                        month_key = dt.strftime('%Y-%m')
-                        if month_key not in monthly_spending:
-                            monthly_spending[month_key] = 0.0
-                        monthly_spending[month_key] += total
-                        if month_key == current_month:
-                            current_month_spending += total
-                    except Exception:
-                        continue
-        first_purchase = min(purchase_dates).isoformat() if purchase_dates else None
-        recent_purchase = max(purchase_dates).isoformat() if purchase_dates else None
-        # Find month with most spending
-        most_spending_month = None
-        most_spending_amount = 0.0
-        for month, amount in monthly_spending.items():
-            if amount > most_spending_amount:
-                most_spending_month = month
-                most_spending_amount = amount
-        summary = {
-            'first_purchase': first_purchase,
-            'recent_purchase': recent_purchase,
-            'current_month_spending': current_month_spending,
-            'most_spending_month': most_spending_month,
-            'most_spending_amount': most_spending_amount
-        }
+        summary = get_customer_engine(customer_name).customer_summary(customer_name)
         return jsonify({'success': True, 'summary': summary})
     except Exception as e:
         return handle_database_error(e, "fetching customer summary")
@@ -1658,26 +3297,9 @@ def get_spending_by_item_category(customer_name):
     """Return total amount spent per item and category for a specific customer."""
     try:
         customer_name = unquote(customer_name)
-        sales_ref = db.collection('sales')
-        spending = {}
-        for doc in sales_ref.stream():
-            sale = doc.to_dict()
-            if sale.get('customer_name') == customer_name:
-                items = sale.get('items', [])
-                for item in items:
-                    item_name = item.get('name', 'Unknown')
-                    category = item.get('category', 'Uncategorized')
-                    price = float(item.get('price', 0))
-                    quantity = int(item.get('quantity', 1))
-                    amount = price * quantity
-                    key = (item_name, category)
-                    if key not in spending:
-                        spending[key] = 0.0
-                    spending[key] += amount
-        # Format for frontend
         result = [
-            {'item': k[0], 'category': k[1], 'amount': v}
-            for k, v in spending.items()
+            {'item': row['item'], 'category': row['category'], 'amount': row['amount']}
+            for row in get_customer_engine(customer_name).customer_item_spending(customer_name)
         ]
         return jsonify({'success': True, 'spending': result})
     except Exception as e:
@@ -1690,24 +3312,7 @@ def get_spending_table(customer_name):
     """Return a table of items with category, quantity, and total spent for a specific customer."""
     try:
         customer_name = unquote(customer_name)
-        sales_ref = db.collection('sales')
-        table = {}
-        for doc in sales_ref.stream():
-            sale = doc.to_dict()
-            if sale.get('customer_name') == customer_name:
-                items = sale.get('items', [])
-                for item in items:
-                    item_name = item.get('name', 'Unknown')
-                    category = item.get('category', 'Uncategorized')
-                    price = float(item.get('price', 0))
-                    quantity = int(item.get('quantity', 1))
-                    amount = price * quantity
-                    key = (item_name, category)
-                    if key not in table:
-                        table[key] = {'item': item_name, 'category': category, 'quantity': 0, 'amount': 0.0}
-                    table[key]['quantity'] += quantity
-                    table[key]['amount'] += amount
-        result = list(table.values())
+        result = get_customer_engine(customer_name).customer_item_spending(customer_name)
         return jsonify({'success': True, 'table': result})
     except Exception as e:
         return handle_database_error(e, "fetching spending table")
@@ -1719,58 +3324,205 @@ def get_top_items_monthly_spending(customer_name):
     """Return top 3 items and their monthly spending for a specific customer (for a grouped bar chart)."""
     try:
         customer_name = unquote(customer_name)
-        sales_ref = db.collection('sales')
-        item_totals = {}
-        monthly_spending = {}
-        months_set = set()
-        for doc in sales_ref.stream():
-            sale = doc.to_dict()
-            if sale.get('customer_name') == customer_name:
-                sale_date = sale.get('date')
-                if not sale_date:
-                    continue
-                try:
-                    dt = datetime.fromisoformat(sale_date)
-                    month_key = dt.strftime('%Y-%m')
-                except Exception:
-                    continue
-                months_set.add(month_key)
-                items = sale.get('items', [])
-                for item in items:
-                    item_name = item.get('name', 'Unknown')
-                    price = float(item.get('price', 0))
-                    quantity = int(item.get('quantity', 1))
-                    amount = price * quantity
-                    # Track total per item
-                    if item_name not in item_totals:
-                        item_totals[item_name] = 0.0
-                    item_totals[item_name] += amount
-                    # Track monthly per item
-                    if item_name not in monthly_spending:
-                        monthly_spending[item_name] = {}
-                    if month_key not in monthly_spending[item_name]:
-                        monthly_spending[item_name][month_key] = 0.0
-                    monthly_spending[item_name][month_key] += amount
-        # Get top 3 items
-        top_items = sorted(item_totals.items(), key=lambda x: x[1], reverse=True)[:3]
-        top_item_names = [item[0] for item in top_items]
-        # Get all months in range (sorted)
-        months = sorted(list(months_set))
-        # Prepare data for frontend
-        result = {
-            'months': months,
-            'items': []
-        }
-        for item_name in top_item_names:
-            item_data = {
-                'name': item_name,
-                'monthly': [monthly_spending[item_name].get(month, 0.0) for month in months]
-            }
-            result['items'].append(item_data)
+        result = get_customer_engine(customer_name).customer_top_items_monthly(customer_name, top=3)
         return jsonify({'success': True, 'data': result})
     except Exception as e:
         return handle_database_error(e, "fetching top items monthly spending")
 
+CUSTOMER_ANALYTICS_SECTIONS = ('stats', 'summary', 'purchases', 'spending_table', 'spending_by_item_category', 'top_items_monthly_spending')
+CUSTOMER_ENGINE_SECTIONS = {'summary', 'spending_table', 'spending_by_item_category', 'top_items_monthly_spending'}
+
+def customer_analytics_etag(customer_name, sections):
+    """Build an ETag from the customer's stats document and profile update times.
+    
+    Every sale, edit or delete for the customer writes its customer_stats
+    document (including a server timestamp), so the document's update_time
+    stands in for the sales themselves without reading them.
+    """
+    stats = db.collection('customer_stats').document(customer_doc_id(customer_name)).get(field_paths=['last_sale_change'])
+    profile = find_customer_profile(customer_name, ['updated_at'])
+    fingerprint = {
+        'stats_updated_at': stats.update_time if stats.exists else None,
+        'profile_updated_at': profile.to_dict().get('updated_at') if profile else None,
+        'sections': sections
+    }
+    if 'summary' in sections:
+        # current_month_spending rolls over with the calendar
+        fingerprint['month'] = datetime.now().strftime('%Y-%m')
+    return hashlib.sha1(json.dumps(fingerprint, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+@app.route('/api/customers/<path:customer_name>/analytics', methods=['GET'])
+@validate_session
+@staff_required
+def get_customer_analytics(customer_name):
+    """Return several customer profile views from a single read of the customer's sales.
+    
+    ``sections`` is a comma-separated subset of CUSTOMER_ANALYTICS_SECTIONS
+    (all of them by default). A request whose If-None-Match matches the
+    current ETag gets a 304 without any aggregation.
+    """
+    try:
+        customer_name = unquote(customer_name)
+        sections = [name.strip() for name in request.args.get('sections', '').split(',') if name.strip()]
+        unknown = [name for name in sections if name not in CUSTOMER_ANALYTICS_SECTIONS]
+        if unknown:
+            return handle_validation_error(f"Unknown sections: {', '.join(unknown)}")
+        sections = sorted(set(sections or CUSTOMER_ANALYTICS_SECTIONS))
+        
+        etag = customer_analytics_etag(customer_name, sections)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        
+        records = list(load_sales_records(customer_sales_query(customer_name, SALES_ENGINE_FIELDS)))
+        result = {'success': True}
+        
+        if 'stats' in sections or 'purchases' in sections:
+            total_spent = 0.0
+            dates = []
+            dated_purchases = []
+            for _, sale, dt in records:
+                total_spent += float(sale.get('total', 0))
+                if dt:
+                    dates.append(dt)
+                dated_purchases.append((dt or datetime.min, {
+                    'date': sale.get('date'),
+                    'total': float(sale.get('total', 0)),
+                    'items': sale.get('items', [])
+                }))
+            if 'stats' in sections:
+                result['stats'] = {
+                    'total_purchases': len(records),
+                    'total_spent': total_spent,
+                    'avg_order_value': total_spent / len(records) if records else 0,
+                    'first_purchase': min(dates).isoformat() if dates else None,
+                    'last_purchase': max(dates).isoformat() if dates else None
+                }
+            if 'purchases' in sections:
+                dated_purchases.sort(key=lambda x: x[0], reverse=True)
+                result['purchases'] = [purchase for _, purchase in dated_purchases]
+        
+        if CUSTOMER_ENGINE_SECTIONS.intersection(sections):
+            columns = SalesColumns()
+            columns.load(records)
+            if 'summary' in sections:
+                result['summary'] = columns.customer_summary(customer_name)
+            if 'spending_table' in sections or 'spending_by_item_category' in sections:
+                table = columns.customer_item_spending(customer_name)
+                if 'spending_table' in sections:
+                    result['spending_table'] = table
+                if 'spending_by_item_category' in sections:
+                    result['spending_by_item_category'] = [
+                        {'item': row['item'], 'category': row['category'], 'amount': row['amount']}
+                        for row in table
+                    ]
+            if 'top_items_monthly_spending' in sections:
+                result['top_items_monthly_spending'] = columns.customer_top_items_monthly(customer_name, top=3)
+        
+        response = jsonify(result)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    except Exception as e:
+        return handle_database_error(e, "fetching customer analytics")
+
+# Statistics API
+STATISTICS_GRANULARITIES = {
+    'day': '%Y-%m-%d',
+    'week': '%G-W%V',
+    'month': '%Y-%m'
+}
+
+def parse_list_arg(name):
+    """Read a repeated query parameter as a list of non-empty values."""
+    return [value.strip() for value in request.args.getlist(name) if value.strip()]
+
+def aggregate_statistics_from_rollups(start_dt, end_dt, bucket_format, products=None):
+    """Statistics straight from the daily rollups, one document per day.
+    
+    Without ``products`` every sale counts. With them, only the selected
+    products' lines do: the series and customer totals are their revenue,
+    and customer_product_totals comes from the rollups' item_customers map.
+    """
+    fields = ['day', 'gross_total', 'customers', 'items', 'item_revenue'] + (['item_customers'] if products else [])
+    totals_by_bucket = {}
+    customer_totals = {}
+    product_totals = {}
+    customer_product_totals = {}
+    for doc in rollup_days_query(start_dt, end_dt).select(fields).stream():
+        rollup = doc.to_dict()
+        bucket = datetime.strptime(rollup.get('day', doc.id), '%Y-%m-%d').strftime(bucket_format)
+        item_revenue = rollup.get('item_revenue', {})
+        if products:
+            if not any(rollup.get('items', {}).get(name) for name in products):
+                continue
+            totals_by_bucket[bucket] = totals_by_bucket.get(bucket, 0.0) + sum(float(item_revenue.get(name, 0)) for name in products)
+            for item_name in products:
+                for customer_name, amount in rollup.get('item_customers', {}).get(item_name, {}).items():
+                    customer_totals[customer_name] = customer_totals.get(customer_name, 0.0) + float(amount)
+                    spending = customer_product_totals.setdefault(customer_name, {})
+                    spending[item_name] = spending.get(item_name, 0.0) + float(amount)
+        else:
+            totals_by_bucket[bucket] = totals_by_bucket.get(bucket, 0.0) + float(rollup.get('gross_total', 0))
+            for customer_name, entry in rollup.get('customers', {}).items():
+                customer_totals[customer_name] = customer_totals.get(customer_name, 0.0) + float(entry.get('total', 0))
+        for item_name, quantity in rollup.get('items', {}).items():
+            if products and item_name not in products:
+                continue
+            entry = product_totals.setdefault(item_name, {'quantity': 0, 'amount': 0.0})
+            entry['quantity'] += int(quantity)
+            entry['amount'] += float(item_revenue.get(item_name, 0))
+    
+    buckets = sorted(totals_by_bucket)
+    return {
+        'buckets': buckets,
+        'series': [{'label': 'Total', 'values': [totals_by_bucket[bucket] for bucket in buckets]}] if buckets else [],
+        'customer_totals': {name: total for name, total in customer_totals.items() if total},
+        'product_totals': {name: entry for name, entry in product_totals.items() if entry['quantity']},
+        'customer_product_totals': {
+            name: {item_name: amount for item_name, amount in spending.items() if amount}
+            for name, spending in customer_product_totals.items() if any(spending.values())
+        }
+    }
+
+@app.route('/api/statistics/series', methods=['GET'])
+@validate_session
+@staff_required
+def get_statistics_series():
+    """Return aggregated chart data for the statistics page.
+    
+    Query parameters: ``customers`` and ``products`` (repeated),
+    ``startDate``/``endDate`` (YYYY-MM-DD, inclusive) and
+    ``granularity`` (day, week or month). Only the aggregates are returned.
+    """
+    try:
+        customers = parse_list_arg('customers')
+        products = parse_list_arg('products')
+        granularity = request.args.get('granularity', 'month')
+        if granularity not in STATISTICS_GRANULARITIES:
+            return handle_validation_error('granularity must be day, week or month')
+        bucket_format = STATISTICS_GRANULARITIES[granularity]
+        
+        start_date = request.args.get('startDate', '')
+        end_date = request.args.get('endDate', '')
+        try:
+            start_dt = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+            end_dt = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1) if end_date else None
+        except ValueError:
+            return handle_validation_error('Dates must use YYYY-MM-DD')
+        
+        if not customers:
+            # The rollups hold per-item totals too, so only a customer selection needs the sales engine
+            result = aggregate_statistics_from_rollups(start_dt, end_dt, bucket_format, products)
+        else:
+            result = get_sales_engine().statistics(customers, products, start_dt, end_dt, granularity)
+        
+        return jsonify({'success': True, 'granularity': granularity, **result})
+        
+    except Exception as e:
+        return handle_database_error(e, "loading statistics")
+
 @app.route('/statistics')
 @validate_session
 @staff_required
@@ -1779,6 +3531,236 @@ def statistics():
         return redirect(url_for('dashboard'))
     return render_template('statistics.html')
 
+# Maintenance commands (run with `flask --app Myapp <command>`)
+MIGRATION_BATCH_SIZE = 400  # Firestore allows at most 500 writes per batch
+
+def backfill_sale_dates_chunk(docs):
+    """Write the native date fields for one chunk of sale documents."""
+    batch = db.batch()
+    updated = 0
+    skipped = 0
+    for doc in docs:
+        sale = doc.to_dict()
+        if isinstance(sale.get('date_ts'), datetime) and sale.get('day'):
+            continue
+        try:
+            dt = datetime.fromisoformat(sale.get('date', ''))
+        except (ValueError, TypeError):
+            skipped += 1
+            continue
+        batch.update(doc.reference, sale_date_fields(dt))
+        updated += 1
+    if updated:
+        batch.commit()
+    return updated, skipped
+
+@app.cli.command('backfill-sale-dates')
+@click.option('--chunk-size', default=MIGRATION_BATCH_SIZE, show_default=True, help='Sales per write batch.')
+@click.option('--workers', default=4, show_default=True, help='Batches committed in parallel.')
+@click.option('--restart', is_flag=True, help='Ignore the saved checkpoint and start from the beginning.')
+def backfill_sale_dates(chunk_size, workers, restart):
+    """Backfill date_ts, date_epoch and day on existing sales.
+    
+    Sales are read in document id order, a round of chunks is committed in
+    parallel, and a checkpoint in migrations/backfill_sale_dates records the
+    last processed id so an interrupted run resumes where it stopped.
+    """
+    if not use_firebase:
+        click.echo('Firebase is not configured; nothing to backfill.')
+        return
+    
+    chunk_size = max(1, min(chunk_size, 500))
+    workers = max(1, workers)
+    checkpoint_ref = db.collection('migrations').document('backfill_sale_dates')
+    checkpoint = {} if restart else (checkpoint_ref.get().to_dict() or {})
+    last_id = checkpoint.get('last_id')
+    updated_total = checkpoint.get('updated', 0)
+    skipped_total = checkpoint.get('skipped', 0)
+    document_id = FieldPath.document_id()
+    
+    if last_id:
+        click.echo(f'Resuming after sale {last_id}')
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            query = db.collection('sales').order_by(document_id)
+            if last_id:
+                query = query.start_after({document_id: last_id})
+            docs = list(query.limit(chunk_size * workers).stream())
+            if not docs:
+                break
+            
+            chunks = [docs[i:i + chunk_size] for i in range(0, len(docs), chunk_size)]
+            for updated, skipped in executor.map(backfill_sale_dates_chunk, chunks):
+                updated_total += updated
+                skipped_total += skipped
+            
+            last_id = docs[-1].id
+            checkpoint_ref.set({
+                'last_id': last_id,
+                'updated': updated_total,
+                'skipped': skipped_total,
+                'updated_at': datetime.now().isoformat()
+            })
+            click.echo(f'Processed through {last_id}: {updated_total} updated, {skipped_total} skipped')
+    
+    checkpoint_ref.set({'completed_at': datetime.now().isoformat()}, merge=True)
+    click.echo(f'Backfill complete: {updated_total} updated, {skipped_total} skipped (unparseable date)')
+
+@app.cli.command('rebuild-sales-rollups')
+def rebuild_sales_rollups():
+    """Recompute every sales_daily rollup document from the sales collection."""
+    if not use_firebase:
+        click.echo('Firebase is not configured; nothing to rebuild.')
+        return
+    
+    rollups = {}
+    for doc in db.collection('sales').stream():
+        sale = {'id': doc.id, **doc.to_dict()}
+        day = sale_day(sale)
+        if day:
+            merge_counts(rollups.setdefault(day, {}), sale_rollup_contribution(sale))
+    
+    rollups_ref = db.collection('sales_daily')
+    stale_refs = [doc.reference for doc in rollups_ref.stream() if doc.id not in rollups]
+    writes = [('delete', ref, None) for ref in stale_refs]
+    writes += [('set', rollups_ref.document(day), {'day': day, **rollup}) for day, rollup in rollups.items()]
+    
+    commit_writes_in_batches(writes, MIGRATION_BATCH_SIZE)
+    
+    click.echo(f'Rebuilt {len(rollups)} daily rollups, removed {len(stale_refs)} stale ones')
+
+@app.cli.command('rebuild-customer-stats')
+def rebuild_customer_stats():
+    """Recompute every customer_stats document from the sales collection."""
+    if not use_firebase:
+        click.echo('Firebase is not configured; nothing to rebuild.')
+        return
+    
+    stats = {}
+    for doc in db.collection('sales').stream():
+        sale = doc.to_dict()
+        customer_name = sale.get('customer_name', 'Walk-in Customer')
+        entry = stats.setdefault(customer_name, {'name': customer_name})
+        merge_counts(entry, customer_stats_contribution(sale))
+        epoch = sale_epoch(sale)
+        if epoch is not None:
+            entry['first_purchase_epoch'] = min(entry.get('first_purchase_epoch', epoch), epoch)
+            entry['last_purchase_epoch'] = max(entry.get('last_purchase_epoch', epoch), epoch)
+    
+    stats_ref = db.collection('customer_stats')
+    live_ids = {customer_doc_id(name) for name in stats}
+    stale_refs = [doc.reference for doc in stats_ref.stream() if doc.id not in live_ids]
+    writes = [('delete', ref, None) for ref in stale_refs]
+    writes += [('set', stats_ref.document(customer_doc_id(name)), entry) for name, entry in stats.items()]
+    
+    commit_writes_in_batches(writes, MIGRATION_BATCH_SIZE)
+    
+    click.echo(f'Rebuilt stats for {len(stats)} customers, removed {len(stale_refs)} stale ones')
+
+@app.cli.command('migrate-customer-profiles')
+def migrate_customer_profiles():
+    """Move customer profiles saved under random ids to ids keyed by customer name."""
+    if not use_firebase:
+        click.echo('Firebase is not configured; nothing to migrate.')
+        return
+    
+    moves = []
+    for doc in db.collection('customers').stream():
+        profile = doc.to_dict()
+        if profile.get('name') and doc.id != customer_doc_id(profile['name']):
+            moves.append((doc, profile))
+    
+    # Each move is a set plus a delete
+    for start in range(0, len(moves), MIGRATION_BATCH_SIZE // 2):
+        batch = db.batch()
+        for doc, profile in moves[start:start + MIGRATION_BATCH_SIZE // 2]:
+            batch.set(customer_profile_ref(profile['name']), profile, merge=True)
+            batch.delete(doc.reference)
+        batch.commit()
+    
+    click.echo(f'Moved {len(moves)} customer profiles to name-keyed ids')
+
+@app.cli.command('migrate-profile-pictures')
+def migrate_profile_pictures():
+    """Move inline data-URL profile pictures into the image store."""
+    if not use_firebase:
+        click.echo('Firebase is not configured; nothing to migrate.')
+        return
+    
+    moved = 0
+    failed = 0
+    batch = db.batch()
+    pending = 0
+    for doc in db.collection('customers').select(['profile_picture']).stream():
+        picture = doc.to_dict().get('profile_picture') or ''
+        if not picture.startswith('data:'):
+            continue
+        try:
+            reference = image_store.save(base64.b64decode(picture.split(',', 1)[1]))
+        except (ValueError, IndexError) as e:
+            click.echo(f'Skipping customer {doc.id}: {e}')
+            failed += 1
+            continue
+        batch.update(doc.reference, {'profile_picture': reference})
+        moved += 1
+        pending += 1
+        if pending == MIGRATION_BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+    
+    click.echo(f'Moved {moved} profile pictures to {image_store.root}, {failed} could not be read')
+
+@app.cli.command('rebuild-category-counts')
+def rebuild_category_counts():
+    """Recompute every category's item_count from the inventory collection."""
+    if not use_firebase:
+        click.echo('Firebase is not configured; nothing to rebuild.')
+        return
+    
+    counts = {}
+    for doc in db.collection('inventory').select(['category']).stream():
+        category = doc.to_dict().get('category')
+        counts[category] = counts.get(category, 0) + 1
+    
+    categories = list(db.collection('categories').select(['name']).stream())
+    writes = [('update', doc.reference, {'item_count': counts.get(doc.to_dict().get('name'), 0)}) for doc in categories]
+    commit_writes_in_batches(writes, MIGRATION_BATCH_SIZE)
+    
+    click.echo(f'Rebuilt item counts for {len(categories)} categories')
+
+@app.cli.command('rebuild-inventory-keys')
+def rebuild_inventory_keys():
+    """Recreate the inventory_keys reservations from the inventory collection and report duplicates."""
+    if not use_firebase:
+        click.echo('Firebase is not configured; nothing to rebuild.')
+        return
+    
+    keys_ref = db.collection('inventory_keys')
+    holders = {doc.id: doc.to_dict().get('item_id') for doc in keys_ref.stream()}
+    groups = {}
+    for doc in db.collection('inventory').select(['name', 'category']).stream():
+        item = doc.to_dict()
+        groups.setdefault(inventory_key_ref(item.get('name'), item.get('category')).id, []).append((doc.id, item))
+    
+    writes = [('delete', keys_ref.document(key_id), None) for key_id in holders if key_id not in groups]
+    for key_id, items in groups.items():
+        item_ids = sorted(item_id for item_id, _ in items)
+        # Keep an existing reservation; otherwise the oldest id wins
+        holder = holders.get(key_id) if holders.get(key_id) in item_ids else item_ids[0]
+        if holders.get(key_id) != holder:
+            writes.append(('set', keys_ref.document(key_id), {'item_id': holder}))
+        if len(items) > 1:
+            _, item = items[0]
+            click.echo(f"Duplicate items for {item.get('name')!r} in {item.get('category')!r}: {', '.join(item_ids)}")
+    
+    commit_writes_in_batches(writes, MIGRATION_BATCH_SIZE)
+    
+    click.echo(f'{len(groups)} (name, category) keys reserved, {len(writes)} reservations written or removed')
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
 
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import re
+import threading
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# Longest edge, in pixels, of each thumbnail generated on upload
+THUMBNAIL_SIZES = {'thumb': 64, 'medium': 256}
+
+STORED_FORMATS = {'PNG': 'png', 'JPEG': 'jpg', 'GIF': 'gif', 'WEBP': 'webp'}
+
+# <sha256>.<ext> for originals, <sha256>-<variant>.jpg for thumbnails
+IMAGE_NAME = re.compile(r'^([0-9a-f]{64})(?:-(%s))?\.(png|jpg|gif|webp)$' % '|'.join(THUMBNAIL_SIZES))
+
+class ImageStore:
+    """Content-addressed image files on the local filesystem.
+
+    An image is stored under the SHA-256 of its bytes, so a stored file never
+    changes and uploading the same picture twice writes it once. The
+    reference handed back (``<sha256>.<ext>``) is all a document needs to keep.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, name):
+        """Return the file path of a stored image or thumbnail name, or None if it is not a valid name."""
+        match = IMAGE_NAME.match(name)
+        if not match:
+            return None
+        return os.path.join(self.root, match.group(1)[:2], name)
+
+    def save(self, data):
+        """Store an uploaded image and its thumbnails; return its reference.
+
+        Raises ValueError if ``data`` is not an image in a supported format.
+        """
+        try:
+            image = Image.open(BytesIO(data))
+            image.verify()
+            image = Image.open(BytesIO(data))
+        except Exception as e:
+            raise ValueError('Not a valid image') from e
+        extension = STORED_FORMATS.get(image.format)
+        if not extension:
+            raise ValueError(f'Unsupported image format: {image.format}')
+
+        digest = hashlib.sha256(data).hexdigest()
+        reference = f'{digest}.{extension}'
+        original_path = self.path(reference)
+        if os.path.exists(original_path):
+            return reference
+
+        os.makedirs(os.path.dirname(original_path), exist_ok=True)
+        image = ImageOps.exif_transpose(image)
+        for variant, size in THUMBNAIL_SIZES.items():
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size))
+            if thumbnail.mode != 'RGB':
+                # JPEG has no alpha channel; flatten onto white
+                background = Image.new('RGB', thumbnail.size, (255, 255, 255))
+                rgba = thumbnail.convert('RGBA')
+                background.paste(rgba, mask=rgba.getchannel('A'))
+                thumbnail = background
+            self._write(self.path(self.variant(reference, variant)), lambda f: thumbnail.save(f, 'JPEG', quality=85))
+        # The original goes last so its presence means the thumbnails exist too
+        self._write(original_path, lambda f: f.write(data))
+        return reference
+
+    @staticmethod
+    def variant(reference, variant=None):
+        """Return the stored name of a reference's thumbnail (or the original when ``variant`` is None)."""
+        if variant is None:
+            return reference
+        return f"{reference.split('.', 1)[0]}-{variant}.jpg"
+
+    @staticmethod
+    def etag(name):
+        """Return the ETag of a stored name; content addressing makes the name itself unique."""
+        return name.rsplit('.', 1)[0]
+
+    @staticmethod
+    def _write(path, write):
+        """Write a file atomically so readers never see a partial image."""
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            write(f)
+        os.replace(temp_path, path)
@@ -0,0 +1,387 @@
+import logging
+import threading
+import time
+from datetime import date, datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Offset used to pack a (code, time bucket) pair into one int64 key
+BUCKET_SPAN = 10 ** 7
+
+class CodeBook:
+    """Assigns dense integer codes to labels such as customer or item names."""
+
+    def __init__(self):
+        self.codes = {}
+        self.labels = []
+
+    def encode(self, label):
+        """Return the code for a label, assigning a new one if needed."""
+        code = self.codes.get(label)
+        if code is None:
+            code = len(self.labels)
+            self.codes[label] = code
+            self.labels.append(label)
+        return code
+
+    def lookup(self, labels):
+        """Return the codes of the known labels among ``labels``."""
+        return np.array([self.codes[label] for label in labels if label in self.codes], dtype=np.int64)
+
+class GrowableArray:
+    """A NumPy array with amortized O(1) appends."""
+
+    def __init__(self, dtype, capacity=1024):
+        self._data = np.zeros(capacity, dtype=dtype)
+        self.size = 0
+
+    def append(self, value):
+        if self.size == len(self._data):
+            grown = np.zeros(2 * len(self._data), dtype=self._data.dtype)
+            grown[:self.size] = self._data
+            self._data = grown
+        self._data[self.size] = value
+        self.size += 1
+
+    @property
+    def values(self):
+        """A view of the filled part of the array."""
+        return self._data[:self.size]
+
+def group_sum(keys, weights):
+    """Sum ``weights`` per distinct key. Returns (sorted unique keys, sums)."""
+    if len(keys) == 0:
+        return keys[:0], np.zeros(0, dtype=np.float64)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse.ravel(), weights=weights, minlength=len(unique))
+
+def bucket_label(granularity, key):
+    """Format a day ordinal, week-start ordinal or month code as a label."""
+    key = int(key)
+    if granularity == 'month':
+        year, month_index = divmod(key, 12)
+        return f'{year}-{month_index + 1:02d}'
+    day = date.fromordinal(key)
+    return day.isoformat() if granularity == 'day' else day.strftime('%G-W%V')
+
+class SalesColumns:
+    """Sales held as NumPy columns for vectorized analytics.
+
+    Sale-level columns hold the epoch timestamp, local day ordinal, month code
+    (year * 12 + month - 1), total, customer and staff codes and a liveness
+    flag. Line items live in a second set of columns that point back to their
+    sale row. Edits append a new row and clear the old row's flag; deletes
+    only clear the flag. Undated sales keep NaN/-1 time columns so range and
+    bucket queries skip them.
+
+    All methods are thread-safe. A load builds the new columns without
+    holding the lock, so reads and incremental updates carry on against the
+    current columns meanwhile; updates made during the load are replayed onto
+    the new columns before they are swapped in.
+    """
+
+    SALE_FIELDS = {
+        'ts': np.float64,
+        'day': np.int64,
+        'month': np.int64,
+        'total': np.float64,
+        'customer': np.int64,
+        'staff': np.int64,
+        'live': np.bool_
+    }
+    ITEM_FIELDS = {
+        'sale': np.int64,
+        'item': np.int64,
+        'category': np.int64,
+        'quantity': np.int64,
+        'price': np.float64
+    }
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._journal = None
+        self.loaded_at = None
+        self._reset()
+
+    def _reset(self):
+        self.sales = {name: GrowableArray(dtype) for name, dtype in self.SALE_FIELDS.items()}
+        self.items = {name: GrowableArray(dtype) for name, dtype in self.ITEM_FIELDS.items()}
+        self.customers = CodeBook()
+        self.staff = CodeBook()
+        self.item_names = CodeBook()
+        self.categories = CodeBook()
+        self.rows = {}
+
+    def _append(self, sale_id, sale, dt):
+        old_row = self.rows.get(sale_id)
+        if old_row is not None:
+            self.sales['live'].values[old_row] = False
+
+        row = self.sales['ts'].size
+        self.rows[sale_id] = row
+        values = {
+            'ts': dt.timestamp() if dt else np.nan,
+            'day': dt.toordinal() if dt else -1,
+            'month': dt.year * 12 + dt.month - 1 if dt else -1,
+            'total': float(sale.get('total', 0) or 0),
+            'customer': self.customers.encode(sale.get('customer_name', 'Walk-in Customer')),
+            'staff': self.staff.encode(sale.get('staff_id') or ''),
+            'live': True
+        }
+        for name, value in values.items():
+            self.sales[name].append(value)
+
+        for item in sale.get('items', []):
+            self.items['sale'].append(row)
+            self.items['item'].append(self.item_names.encode(item.get('name', 'Unknown')))
+            self.items['category'].append(self.categories.encode(item.get('category', 'Uncategorized')))
+            self.items['quantity'].append(int(item.get('quantity', 1)))
+            self.items['price'].append(float(item.get('price', 0) or 0))
+
+    def _drop(self, sale_id):
+        row = self.rows.pop(sale_id, None)
+        if row is not None:
+            self.sales['live'].values[row] = False
+
+    def _load(self, records):
+        with self._lock:
+            self._journal = []
+        try:
+            fresh = SalesColumns()
+            for sale_id, sale, dt in records:
+                fresh._append(sale_id, sale, dt)
+        except Exception:
+            with self._lock:
+                self._journal = None
+            raise
+        with self._lock:
+            for sale_id, sale, dt in self._journal:
+                if sale is None:
+                    fresh._drop(sale_id)
+                else:
+                    fresh._append(sale_id, sale, dt)
+            self._journal = None
+            self.sales, self.items, self.rows = fresh.sales, fresh.items, fresh.rows
+            self.customers, self.staff = fresh.customers, fresh.staff
+            self.item_names, self.categories = fresh.item_names, fresh.categories
+            self.loaded_at = time.monotonic()
+
+    def _reload(self, loader):
+        try:
+            self._load(loader())
+        except Exception:
+            logger.exception('Reloading the sales columns failed; the current ones stay in use')
+        finally:
+            self._load_lock.release()
+
+    def load(self, records):
+        """Replace the contents with ``records``, an iterable of (sale_id, sale, datetime)."""
+        with self._load_lock:
+            self._load(records)
+
+    def is_fresh(self, max_age):
+        """Return True when loaded within the last ``max_age`` seconds."""
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at < max_age
+
+    def refresh(self, loader, max_age):
+        """Reload from ``loader()`` when never loaded or older than ``max_age`` seconds.
+
+        Only the first load blocks the caller. Stale columns keep serving
+        while a background thread reloads them, one reload at a time.
+        """
+        if self.is_fresh(max_age):
+            return False
+        if self.loaded_at is None:
+            with self._load_lock:
+                if self.loaded_at is None:
+                    self._load(loader())
+            return True
+        if self._load_lock.acquire(blocking=False):
+            threading.Thread(target=self._reload, args=(loader,), daemon=True).start()
+        return True
+
+    def add(self, sale_id, sale, dt):
+        """Add a new sale or replace the current version of an edited one."""
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((sale_id, sale, dt))
+            if self.loaded_at is not None:
+                self._append(sale_id, sale, dt)
+
+    def remove(self, sale_id):
+        """Drop a deleted sale."""
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((sale_id, None, None))
+            self._drop(sale_id)
+
+    # Masks and keys
+    def sale_mask(self, customers=None, start=None, end=None):
+        """Mask over live sale rows, optionally limited to customers and a [start, end) range."""
+        mask = self.sales['live'].values.copy()
+        if customers is not None:
+            mask &= np.isin(self.sales['customer'].values, self.customers.lookup(customers))
+        ts = self.sales['ts'].values
+        if start is not None:
+            mask &= ts >= start.timestamp()
+        if end is not None:
+            mask &= ts < end.timestamp()
+        return mask
+
+    def item_mask(self, sale_mask, products=None):
+        """Mask over item rows of the masked sales, optionally limited to product names."""
+        mask = sale_mask[self.items['sale'].values]
+        if products is not None:
+            mask &= np.isin(self.items['item'].values, self.item_names.lookup(products))
+        return mask
+
+    def bucket_keys(self, granularity):
+        """Per-sale time bucket keys: day ordinal, week-start ordinal or month code."""
+        if granularity == 'month':
+            return self.sales['month'].values
+        day = self.sales['day'].values
+        if granularity == 'week':
+            return day - (day - 1) % 7  # date.fromordinal(1) is a Monday
+        return day
+
+    # Statistics page
+    def statistics(self, customers, products, start, end, granularity):
+        """Aggregate chart data for the statistics page.
+
+        Sales are kept when they belong to one of ``customers`` and contain one
+        of ``products``; empty lists mean no restriction. The result has the
+        same shape as the statistics API response.
+        """
+        with self._lock:
+            customer_filter = list(customers) or None
+            product_filter = list(products) or None
+            sale_mask = self.sale_mask(customer_filter, start, end) & (self.sales['day'].values >= 0)
+            if product_filter:
+                has_product = np.zeros(len(sale_mask), dtype=bool)
+                has_product[self.items['sale'].values[self.item_mask(sale_mask, product_filter)]] = True
+                sale_mask &= has_product
+
+            totals = self.sales['total'].values[sale_mask]
+            customer_codes = self.sales['customer'].values[sale_mask]
+            bucket_keys = self.bucket_keys(granularity)[sale_mask]
+
+            # Spending per bucket, per customer when customers were selected
+            series_codes = customer_codes if customer_filter else np.zeros(len(totals), dtype=np.int64)
+            pair_keys, pair_sums = group_sum(series_codes * BUCKET_SPAN + bucket_keys, totals)
+            unique_buckets = np.unique(bucket_keys)
+            bucket_index = {int(key): i for i, key in enumerate(unique_buckets)}
+            series_values = {}
+            for pair_key, amount in zip(pair_keys, pair_sums):
+                code, bucket = divmod(int(pair_key), BUCKET_SPAN)
+                label = self.customers.labels[code] if customer_filter else 'Total'
+                values = series_values.setdefault(label, [0.0] * len(unique_buckets))
+                values[bucket_index[bucket]] = float(amount)
+
+            codes, sums = group_sum(customer_codes, totals)
+            customer_totals = {self.customers.labels[int(code)]: float(amount) for code, amount in zip(codes, sums)}
+
+            item_mask = self.item_mask(sale_mask, product_filter)
+            item_codes = self.items['item'].values[item_mask]
+            quantities = self.items['quantity'].values[item_mask]
+            amounts = self.items['price'].values[item_mask] * quantities
+            codes, quantity_sums = group_sum(item_codes, quantities.astype(np.float64))
+            _, amount_sums = group_sum(item_codes, amounts)
+            product_totals = {
+                self.item_names.labels[int(code)]: {'quantity': int(quantity), 'amount': float(amount)}
+                for code, quantity, amount in zip(codes, quantity_sums, amount_sums)
+            }
+
+            item_customers = self.sales['customer'].values[self.items['sale'].values[item_mask]]
+            pair_keys, pair_sums = group_sum(item_customers * BUCKET_SPAN + item_codes, amounts)
+            customer_product_totals = {}
+            for pair_key, amount in zip(pair_keys, pair_sums):
+                customer_code, item_code = divmod(int(pair_key), BUCKET_SPAN)
+                customer_product_totals.setdefault(self.customers.labels[customer_code], {})[self.item_names.labels[item_code]] = float(amount)
+
+            return {
+                'buckets': [bucket_label(granularity, key) for key in unique_buckets],
+                'series': [{'label': label, 'values': values} for label, values in series_values.items()],
+                'customer_totals': customer_totals,
+                'product_totals': product_totals,
+                'customer_product_totals': customer_product_totals
+            }
+
+    # Customer profile views
+    def customer_summary(self, customer_name, now=None):
+        """First and most recent purchase, current month spending and best month."""
+        now = now or datetime.now()
+        with self._lock:
+            mask = self.sale_mask([customer_name]) & (self.sales['day'].values >= 0)
+            ts = self.sales['ts'].values[mask]
+            months = self.sales['month'].values[mask]
+            totals = self.sales['total'].values[mask]
+
+            month_keys, month_sums = group_sum(months, totals)
+            current_month = now.year * 12 + now.month - 1
+            current_month_spending = float(totals[months == current_month].sum())
+
+            most_spending_month = None
+            most_spending_amount = 0.0
+            if len(month_sums) and month_sums.max() > 0:
+                best = int(np.argmax(month_sums))
+                most_spending_month = bucket_label('month', month_keys[best])
+                most_spending_amount = float(month_sums[best])
+
+            return {
+                'first_purchase': datetime.fromtimestamp(ts.min()).isoformat() if len(ts) else None,
+                'recent_purchase': datetime.fromtimestamp(ts.max()).isoformat() if len(ts) else None,
+                'current_month_spending': current_month_spending,
+                'most_spending_month': most_spending_month,
+                'most_spending_amount': most_spending_amount
+            }
+
+    def customer_item_spending(self, customer_name):
+        """Quantity and amount spent per (item, category) for one customer."""
+        with self._lock:
+            item_mask = self.item_mask(self.sale_mask([customer_name]))
+            item_codes = self.items['item'].values[item_mask]
+            category_codes = self.items['category'].values[item_mask]
+            quantities = self.items['quantity'].values[item_mask]
+            amounts = self.items['price'].values[item_mask] * quantities
+
+            keys = item_codes * BUCKET_SPAN + category_codes
+            unique_keys, amount_sums = group_sum(keys, amounts)
+            _, quantity_sums = group_sum(keys, quantities.astype(np.float64))
+            rows = []
+            for key, quantity, amount in zip(unique_keys, quantity_sums, amount_sums):
+                item_code, category_code = divmod(int(key), BUCKET_SPAN)
+                rows.append({
+                    'item': self.item_names.labels[item_code],
+                    'category': self.categories.labels[category_code],
+                    'quantity': int(quantity),
+                    'amount': float(amount)
+                })
+            return rows
+
+    def customer_top_items_monthly(self, customer_name, top=3):
+        """Monthly spending of a customer's ``top`` items by total amount."""
+        with self._lock:
+            sale_mask = self.sale_mask([customer_name]) & (self.sales['day'].values >= 0)
+            months = np.unique(self.sales['month'].values[sale_mask])
+
+            item_mask = self.item_mask(sale_mask)
+            item_codes = self.items['item'].values[item_mask]
+            amounts = self.items['price'].values[item_mask] * self.items['quantity'].values[item_mask]
+            item_months = self.sales['month'].values[self.items['sale'].values[item_mask]]
+
+            codes, item_totals = group_sum(item_codes, amounts)
+            top_codes = codes[np.argsort(-item_totals, kind='stable')[:top]]
+            month_index = {int(month): i for i, month in enumerate(months)}
+
+            result = {'months': [bucket_label('month', month) for month in months], 'items': []}
+            for code in top_codes:
+                selected = item_codes == code
+                monthly = [0.0] * len(months)
+                month_keys, month_sums = group_sum(item_months[selected], amounts[selected])
+                for month, amount in zip(month_keys, month_sums):
+                    monthly[month_index[int(month)]] = float(amount)
+                result['items'].append({'name': self.item_names.labels[int(code)], 'monthly': monthly})
+            return result
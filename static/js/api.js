@@ -111,14 +111,26 @@ class API {
         return this.get(`/api/sales/top-items?${params}`);
     }
     
-    async getFilteredSales(filters, page = 1) {
+    async getFilteredSales(filters, page = 1, cursor = '') {
         const params = new URLSearchParams({
             page: page.toString(),
             ...filters
         });
+        // Cursor tokens make deep pages as cheap as the first one
+        if (cursor) params.set('cursor', cursor);
         return this.get(`/api/sales/filtered?${params}`);
     }
     
+    // Statistics API methods
+    async getStatisticsSeries({ customers = [], products = [], startDate = '', endDate = '', granularity = 'month' } = {}) {
+        const params = new URLSearchParams({ granularity });
+        customers.forEach(customer => params.append('customers', customer));
+        products.forEach(product => params.append('products', product));
+        if (startDate) params.set('startDate', startDate);
+        if (endDate) params.set('endDate', endDate);
+        return this.get(`/api/statistics/series?${params}`);
+    }
+    
     async createSale(saleData) {
         return this.post('/api/sales', saleData);
     }
@@ -152,6 +164,24 @@ class API {
         return this.delete(`/api/inventory/${itemId}`);
     }
     
+    async searchInventory({ q = '', category = '', supplier = '', inStock = false, limit = 20 } = {}) {
+        const params = new URLSearchParams({ q, limit: limit.toString() });
+        if (category) params.set('category', category);
+        if (supplier) params.set('supplier', supplier);
+        if (inStock) params.set('in_stock', '1');
+        return this.get(`/api/inventory/search?${params}`);
+    }
+    
+    // Upload a CSV or JSON lines file as the raw request body; the server reads it as it arrives
+    async bulkImportInventory(file) {
+        const format = /\.(jsonl|ndjson)$/i.test(file.name) ? 'jsonl' : 'csv';
+        return this.request(`/api/inventory/bulk?format=${format}`, {
+            method: 'POST',
+            body: file,
+            headers: { 'Content-Type': format === 'csv' ? 'text/csv' : 'application/x-ndjson' }
+        });
+    }
+    
     async getInventoryItem(itemId) {
         return this.get(`/api/inventory/${itemId}`);
     }
@@ -161,6 +191,18 @@ class API {
         return this.get('/api/customers');
     }
     
+    async getCustomersPage({ sort = 'name', limit = 50, cursor = '', fields = [] } = {}) {
+        const params = new URLSearchParams({ sort, limit: limit.toString() });
+        if (cursor) params.set('cursor', cursor);
+        if (fields.length) params.set('fields', fields.join(','));
+        return this.get(`/api/customers?${params}`);
+    }
+    
+    async searchCustomers(query, limit = 10) {
+        const params = new URLSearchParams({ q: query, limit: limit.toString() });
+        return this.get(`/api/customers/search?${params}`);
+    }
+    
     async getCustomerProfile(customerName) {
         return this.get(`/api/customers/${encodeURIComponent(customerName)}`);
     }
@@ -169,8 +211,10 @@ class API {
         return this.postFormData('/api/customers/update', formData);
     }
     
-    async getCustomerSales(customerName, page = 1, limit = 20) {
-        return this.get(`/api/customers/${encodeURIComponent(customerName)}/sales?page=${page}&limit=${limit}`);
+    async getCustomerSales(customerName, page = 1, limit = 20, cursor = '') {
+        const params = new URLSearchParams({ page: page.toString(), limit: limit.toString() });
+        if (cursor) params.set('cursor', cursor);
+        return this.get(`/api/customers/${encodeURIComponent(customerName)}/sales?${params}`);
     }
     
     // Suppliers API methods
@@ -1,7 +1,15 @@
 // Customers Module
+const CUSTOMERS_PAGE_SIZE = 50;
+const CUSTOMER_SEARCH_RESULTS = 50;
+const CUSTOMER_LIST_FIELDS = ['name', 'age', 'sex', 'address', 'profile_picture', 'total_sales', 'total_spent', 'last_purchase'];
+
 class CustomerManager {
     constructor() {
         this.currentCustomerProfile = null;
+        this.customers = [];
+        this.nextCursor = null;
+        this.listSort = 'name';
+        this.listRequest = 0;
         this.init();
     }
     
@@ -20,28 +28,48 @@ class CustomerManager {
     }
     
     // Customer list management
+    async fetchCustomersPage(cursor = '') {
+        return window.api.getCustomersPage({
+            sort: this.listSort,
+            limit: CUSTOMERS_PAGE_SIZE,
+            cursor,
+            fields: CUSTOMER_LIST_FIELDS
+        });
+    }
+    
+    // Changing the sort reloads from the server, which pages in that order
+    setListSort(sort) {
+        this.listSort = sort;
+        return this.refreshCustomers();
+    }
+    
     async refreshCustomers() {
         const container = document.getElementById('customersContainer');
         if (!container) return;
+        const request = ++this.listRequest;
         
         // Show loading state
         container.innerHTML = '<div class="loading-state"><i class="fas fa-spinner fa-spin"></i> Loading customers...</div>';
         
         try {
-            const data = await window.api.getCustomers();
+            // The first screen is one server page; more pages load on demand
+            const data = await this.fetchCustomersPage();
+            // A search or newer reload has started meanwhile
+            if (request !== this.listRequest) return;
             
             if (!data || !data.success) {
                 container.innerHTML = '<div class="empty-state">Error loading customers</div>';
                 return;
             }
             
-            const customers = data.customers || [];
-            if (customers.length === 0) {
+            this.customers = data.customers || [];
+            this.nextCursor = data.next_cursor;
+            if (this.customers.length === 0) {
                 container.innerHTML = '<div class="empty-state">No customers found</div>';
                 return;
             }
             
-            this.renderCustomersList(customers);
+            this.renderCustomersList(this.customers);
             
         } catch (error) {
             console.error('Error loading customers:', error);
@@ -50,9 +78,50 @@ class CustomerManager {
         }
     }
     
-    renderCustomersList(customers) {
+    // Search the whole customer list on the server, not just the loaded pages
+    async searchCustomers(query) {
         const container = document.getElementById('customersContainer');
         if (!container) return;
+        if (!query.trim()) {
+            return this.refreshCustomers();
+        }
+        
+        const request = ++this.listRequest;
+        try {
+            const data = await window.api.searchCustomers(query, CUSTOMER_SEARCH_RESULTS);
+            // A newer search or reload has started meanwhile
+            if (request !== this.listRequest) return;
+            
+            if (!data || !data.success) {
+                container.innerHTML = '<div class="empty-state">Error searching customers</div>';
+                return;
+            }
+            
+            this.customers = data.customers || [];
+            this.nextCursor = null;
+            if (this.customers.length === 0) {
+                container.innerHTML = '<div class="empty-state">No customers found matching your search</div>';
+                return;
+            }
+            
+            // Results come ranked by total spent
+            this.renderCustomersList(this.customers, false);
+        } catch (error) {
+            console.error('Error searching customers:', error);
+            window.utils.showNotification('Error searching customers', 'error');
+        }
+    }
+    
+    renderCustomersList(customers, grouped = this.listSort === 'name') {
+        const container = document.getElementById('customersContainer');
+        if (!container) return;
+        
+        if (!grouped) {
+            // Keep the server's order (sort or search ranking) in one flat list
+            container.innerHTML = `<div class="customer-category-items">${customers.map(customer => this.createCustomerCard(customer)).join('')}</div>`;
+            this.renderLoadMore(container);
+            return;
+        }
         
         // Sort customers alphabetically by name
         customers.sort((a, b) => a.name.localeCompare(b.name));
@@ -86,6 +155,36 @@ class CustomerManager {
         }).join('');
         
         container.innerHTML = groupedHTML;
+        this.renderLoadMore(container);
+    }
+    
+    renderLoadMore(container) {
+        if (this.nextCursor) {
+            container.insertAdjacentHTML('beforeend', `
+                <div class="load-more-section">
+                    <button class="action-btn secondary" onclick="window.customerManager.loadMoreCustomers()">
+                        <i class="fas fa-chevron-down"></i> Load more customers
+                    </button>
+                </div>
+            `);
+        }
+    }
+    
+    async loadMoreCustomers() {
+        if (!this.nextCursor) return;
+        try {
+            const data = await this.fetchCustomersPage(this.nextCursor);
+            if (!data || !data.success) {
+                window.utils.showNotification('Error loading customers', 'error');
+                return;
+            }
+            this.customers = this.customers.concat(data.customers || []);
+            this.nextCursor = data.next_cursor;
+            this.renderCustomersList(this.customers);
+        } catch (error) {
+            console.error('Error loading more customers:', error);
+            window.utils.showNotification('Error loading customers', 'error');
+        }
     }
     
     createCustomerCard(customer) {
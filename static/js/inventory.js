@@ -308,6 +308,38 @@ class InventoryManager {
         }
     }
     
+    // Bulk create and update from a CSV or JSON lines file (id, name, category, stock, price, supplier)
+    async importInventoryFile(input) {
+        const file = input.files[0];
+        input.value = '';
+        if (!file) return;
+        
+        try {
+            const data = await window.api.bulkImportInventory(file);
+            if (!data || !data.success) {
+                window.utils.showNotification(data ? (data.error || 'Error importing items') : 'Error importing items', 'error');
+                return;
+            }
+            
+            const message = `Imported ${data.created} new and ${data.updated} updated items`;
+            if (data.failed) {
+                console.warn('Rows not imported:', data.errors);
+                const firstErrors = data.errors.slice(0, 3).map(error => `row ${error.row}: ${error.error}`).join('; ');
+                window.utils.showNotification(`${message}; ${data.failed} rows failed (${firstErrors})`, 'error');
+            } else {
+                window.utils.showNotification(message, 'success');
+            }
+            this.refreshInventoryTable();
+            this.refreshFilterOptions();
+            if (document.getElementById('categoriesTableBody')) {
+                this.refreshCategories();
+            }
+        } catch (error) {
+            console.error('Error importing items:', error);
+            window.utils.showNotification('Error importing items', 'error');
+        }
+    }
+    
     // Dropdown loading
     async loadCategoriesForDropdown() {
         const select = document.getElementById('itemCategory');
@@ -461,19 +493,19 @@ class InventoryManager {
         if (!tbody) return;
         
         // Show loading state
-        tbody.innerHTML = '<tr><td colspan="5" class="text-center">Loading suppliers...</td></tr>';
+        tbody.innerHTML = '<tr><td colspan="8" class="text-center">Loading suppliers...</td></tr>';
         
         try {
             const data = await window.api.getSuppliers();
             
             if (!data || !data.success) {
-                tbody.innerHTML = `<tr><td colspan="5" class="text-center text-danger">Error: ${window.utils.escapeHtml(data?.message || 'Failed to load suppliers.')}</td></tr>`;
+                tbody.innerHTML = `<tr><td colspan="8" class="text-center text-danger">Error: ${window.utils.escapeHtml(data?.message || 'Failed to load suppliers.')}</td></tr>`;
                 return;
             }
             
             const suppliers = data.suppliers || [];
             if (suppliers.length === 0) {
-                tbody.innerHTML = '<tr><td colspan="5" class="text-center">No suppliers found.</td></tr>';
+                tbody.innerHTML = '<tr><td colspan="8" class="text-center">No suppliers found.</td></tr>';
                 return;
             }
             
@@ -481,7 +513,7 @@ class InventoryManager {
             
         } catch (error) {
             console.error('Error loading suppliers:', error);
-            tbody.innerHTML = '<tr><td colspan="5" class="text-center text-danger">Error loading suppliers. Please try again.</td></tr>';
+            tbody.innerHTML = '<tr><td colspan="8" class="text-center text-danger">Error loading suppliers. Please try again.</td></tr>';
             window.utils.showNotification('Error loading suppliers', 'error');
         }
     }
@@ -496,6 +528,11 @@ class InventoryManager {
                 <td>${window.utils.escapeHtml(supplier.contact_person || 'N/A')}</td>
                 <td>${window.utils.escapeHtml(supplier.email || 'N/A')}</td>
                 <td>${window.utils.escapeHtml(supplier.phone || 'N/A')}</td>
+                <td>${supplier.summary?.item_count ?? 0}</td>
+                <td>${window.utils.formatCurrency(supplier.summary?.stock_value ?? 0)}</td>
+                <td>
+                    <span class="stock-badge ${supplier.summary?.low_stock_count ? 'low-stock' : 'in-stock'}">${supplier.summary?.low_stock_count ?? 0}</span>
+                </td>
                 <td>
                     <div class="action-buttons">
                         <button class="action-btn secondary btn-sm" onclick="window.inventoryManager.editSupplier('${supplier.id}')" title="Edit Supplier">
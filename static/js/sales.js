@@ -2,6 +2,9 @@
 class SalesManager {
     constructor() {
         this.cart = [];
+        // Cursor tokens for visited pages of the filtered sales listing
+        this.pageCursors = {};
+        this.filteredTotals = null;
         console.log('[Make Sale] SalesManager instance created:', this);
         this.init();
     }
@@ -30,37 +33,9 @@ class SalesManager {
         });
     }
     
-    // Sales history management
+    // Sales history management; reloads the first page with the last filters used
     async refreshSales() {
-        const tbody = document.getElementById('salesTableBody');
-        if (!tbody) return;
-        
-        // Show loading state
-        tbody.innerHTML = '<tr><td colspan="5" class="text-center">Loading sales history...</td></tr>';
-        
-        try {
-            const data = await window.api.getSales();
-            
-            if (!data || !data.success) {
-                tbody.innerHTML = `<tr><td colspan="5" class="text-center text-danger">Error: ${window.utils.escapeHtml(data?.message || 'Failed to load sales history.')}</td></tr>`;
-                return;
-            }
-            
-            const sales = data.sales || [];
-            if (sales.length === 0) {
-                tbody.innerHTML = '<tr><td colspan="5" class="text-center">No sales found.</td></tr>';
-                // Update summary with empty data
-                this.updateSalesSummary([]);
-                return;
-            }
-            
-            this.renderSalesTable(sales);
-            
-        } catch (error) {
-            console.error('Error loading sales:', error);
-            tbody.innerHTML = '<tr><td colspan="5" class="text-center text-danger">Error loading sales history. Please try again.</td></tr>';
-            window.utils.showNotification('Error loading sales history', 'error');
-        }
+        return this.refreshSalesWithFilters(this.lastFilters || {}, 1);
     }
     
     // Refresh sales with filters
@@ -71,19 +46,37 @@ class SalesManager {
         // Show loading state
         tbody.innerHTML = '<tr><td colspan="5" class="text-center">Loading filtered sales...</td></tr>';
         
+        this.lastFilters = filters;
+        
+        // New filters start a fresh cursor chain
+        if (page === 1) {
+            this.pageCursors = {};
+            this.filteredTotals = null;
+        }
+        
         try {
-            const data = await window.api.getFilteredSales(filters, page);
+            const data = await window.api.getFilteredSales(filters, page, this.pageCursors[page] || '');
             
             if (!data || !data.success) {
                 tbody.innerHTML = `<tr><td colspan="5" class="text-center text-danger">Error: ${window.utils.escapeHtml(data?.message || 'Failed to load filtered sales.')}</td></tr>`;
                 return;
             }
             
+            // Remember where the following page starts; totals only come with uncursored pages
+            if (data.next_cursor) {
+                this.pageCursors[page + 1] = data.next_cursor;
+            }
+            if (data.summary) {
+                this.filteredTotals = { total: data.total, summary: data.summary };
+            } else if (this.filteredTotals) {
+                data.total = this.filteredTotals.total;
+                data.summary = this.filteredTotals.summary;
+            }
+            
             const sales = data.sales || [];
             if (sales.length === 0) {
                 tbody.innerHTML = '<tr><td colspan="5" class="text-center">No sales found with the selected filters.</td></tr>';
-                // Update summary with empty data
-                this.updateSalesSummary([]);
+                this.updateSalesSummaryFromFilteredData(data);
                 // Update pagination
                 if (window.updatePagination) {
                     window.updatePagination(0);
@@ -137,39 +130,6 @@ class SalesManager {
                 </td>
             </tr>
         `).join('');
-        
-        // Update summary cards with sales data
-        this.updateSalesSummary(sales);
-    }
-    
-    // Update sales summary cards
-    updateSalesSummary(sales) {
-        try {
-            let totalSalesAmount = 0;
-            let totalTransactions = 0;
-            let averageOrder = 0;
-            
-            sales.forEach(sale => {
-                const total = parseFloat(sale.total) || 0;
-                totalSalesAmount += total;
-                totalTransactions++;
-            });
-            
-            // Calculate average order value
-            averageOrder = totalTransactions > 0 ? totalSalesAmount / totalTransactions : 0;
-            
-            // Update the summary cards
-            const totalSalesAmountElement = document.getElementById('totalSalesAmount');
-            const totalTransactionsElement = document.getElementById('totalTransactions');
-            const averageOrderElement = document.getElementById('averageOrder');
-            
-            if (totalSalesAmountElement) totalSalesAmountElement.textContent = window.utils.formatCurrency(totalSalesAmount);
-            if (totalTransactionsElement) totalTransactionsElement.textContent = window.utils.formatNumber(totalTransactions);
-            if (averageOrderElement) averageOrderElement.textContent = window.utils.formatCurrency(averageOrder);
-            
-        } catch (error) {
-            console.error('Error updating sales summary:', error);
-        }
     }
     
     // Dashboard recent sales
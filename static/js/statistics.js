@@ -46,79 +46,58 @@ function getCheckedValues(container, className) {
     return Array.from(container.querySelectorAll('input.' + className + ':checked')).map(cb => cb.value);
 }
 
-// Fetch and process statistics data
+// Fetch aggregated statistics for the current selection from the server
 async function fetchStatisticsData() {
     const customerBox = document.getElementById('customerCheckboxes');
     const productBox = document.getElementById('productCheckboxes');
     const selectedCustomers = getCheckedValues(customerBox, 'customer-checkbox');
     const selectedProducts = getCheckedValues(productBox, 'product-checkbox');
-    const salesData = await window.api.getSales();
-    if (!salesData || !salesData.success) return { sales: [] };
-    let sales = salesData.sales || [];
-    // Filter by selected customers
-    if (selectedCustomers.length > 0) {
-        sales = sales.filter(sale => selectedCustomers.includes(sale.customer_name));
-    }
-    // Filter by selected products
-    if (selectedProducts.length > 0) {
-        sales = sales.filter(sale => sale.items.some(item => selectedProducts.includes(item.name)));
-    }
-    return { sales, selectedCustomers, selectedProducts };
+    const stats = await window.api.getStatisticsSeries({
+        customers: selectedCustomers,
+        products: selectedProducts
+    });
+    if (!stats || !stats.success) return { stats: null, selectedCustomers, selectedProducts };
+    return { stats, selectedCustomers, selectedProducts };
 }
 
 // Prepare chart data for different visualizations
-function prepareChartData(sales, chartType, selectedCustomers, selectedProducts) {
+function prepareChartData(stats, chartType, selectedCustomers, selectedProducts) {
+    if (!stats) return { labels: [], datasets: [] };
+    const customerTotals = stats.customer_totals || {};
+    const productTotals = stats.product_totals || {};
+    const customerProductTotals = stats.customer_product_totals || {};
+    
     if (chartType === 'bar') {
         // Bar: Each customer's total spending (optionally per product)
-        let labels = [];
+        const labels = selectedCustomers.length > 0 ? selectedCustomers : Object.keys(customerTotals);
         let datasets = [];
         if (selectedProducts.length > 0) {
             // For each product, show spending per customer
-            labels = selectedCustomers.length > 0 ? selectedCustomers : Array.from(new Set(sales.map(s => s.customer_name)));
             selectedProducts.forEach(product => {
-                const data = labels.map(customer => {
-                    // Sum total spent by this customer on this product
-                    return sales.filter(sale => sale.customer_name === customer)
-                        .reduce((sum, sale) => {
-                            const item = sale.items.find(i => i.name === product);
-                            return sum + (item ? (item.price * item.quantity) : 0);
-                        }, 0);
-                });
                 datasets.push({
                     label: product,
-                    data,
+                    data: labels.map(customer => (customerProductTotals[customer] || {})[product] || 0),
                     backgroundColor: randomColor(product),
                 });
             });
         } else {
             // For each customer, show total spending
-            labels = selectedCustomers.length > 0 ? selectedCustomers : Array.from(new Set(sales.map(s => s.customer_name)));
             datasets = [{
                 label: 'Total Spending',
-                data: labels.map(customer => {
-                    return sales.filter(sale => sale.customer_name === customer)
-                        .reduce((sum, sale) => sum + (parseFloat(sale.total) || 0), 0);
-                }),
+                data: labels.map(customer => customerTotals[customer] || 0),
                 backgroundColor: '#3498db',
             }];
         }
         return { labels, datasets };
     } else if (chartType === 'pie') {
         // Pie: Most frequently purchased items (across selected customers)
-        const itemCounts = {};
-        sales.forEach(sale => {
-            sale.items.forEach(item => {
-                if (selectedProducts.length === 0 || selectedProducts.includes(item.name)) {
-                    itemCounts[item.name] = (itemCounts[item.name] || 0) + (item.quantity || 1);
-                }
-            });
-        });
+        const labels = Object.keys(productTotals);
         return {
-            labels: Object.keys(itemCounts),
+            labels,
             datasets: [{
                 label: 'Purchase Frequency',
-                data: Object.values(itemCounts),
-                backgroundColor: Object.keys(itemCounts).map(randomColor)
+                data: labels.map(name => productTotals[name].quantity),
+                backgroundColor: labels.map(randomColor)
             }]
         };
     }
@@ -175,8 +154,8 @@ function renderStatisticsChart(chartData, chartType) {
 
 async function updateStatisticsChart() {
     const chartType = document.getElementById('chartTypeSelector').value;
-    const { sales, selectedCustomers, selectedProducts } = await fetchStatisticsData();
-    const chartData = prepareChartData(sales, chartType, selectedCustomers, selectedProducts);
+    const { stats, selectedCustomers, selectedProducts } = await fetchStatisticsData();
+    const chartData = prepareChartData(stats, chartType, selectedCustomers, selectedProducts);
     renderStatisticsChart(chartData, chartType);
 }
 
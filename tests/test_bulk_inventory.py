@@ -0,0 +1,205 @@
+import pytest
+
+import Myapp
+
+
+class FakeRef:
+    def __init__(self, store, collection, doc_id):
+        self.store = store
+        self.collection = collection
+        self.id = doc_id
+
+    @property
+    def key(self):
+        return (self.collection, self.id)
+
+
+class FakeSnapshot:
+    def __init__(self, ref):
+        self.id = ref.id
+        self.reference = ref
+        self._data = ref.store.docs.get(ref.key)
+        self.exists = self._data is not None
+
+    def to_dict(self):
+        return dict(self._data or {})
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class FakeCollection:
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    def document(self, doc_id=None):
+        if doc_id is None:
+            self.store.next_id += 1
+            doc_id = f'auto{self.store.next_id:05d}'
+        return FakeRef(self.store, self.name, doc_id)
+
+    def select(self, fields):
+        return self
+
+    def stream(self):
+        return [FakeSnapshot(FakeRef(self.store, collection, doc_id)) for collection, doc_id in list(self.store.docs) if collection == self.name]
+
+
+class FakeBatch:
+    commit_time = None
+
+    def __init__(self, store):
+        self.store = store
+        self.operations = []
+
+    def create(self, ref, data):
+        self.operations.append(('create', ref, data))
+
+    def set(self, ref, data):
+        self.operations.append(('set', ref, data))
+
+    def update(self, ref, data):
+        self.operations.append(('update', ref, data))
+
+    def delete(self, ref):
+        self.operations.append(('delete', ref, None))
+
+    def commit(self):
+        """Apply every operation or none, failing like Firestore on create and update conflicts."""
+        assert len(self.operations) <= Myapp.FIRESTORE_MAX_BATCH_WRITES
+        self.store.commits.append(len(self.operations))
+        if self.store.fail_commits:
+            self.store.fail_commits -= 1
+            raise RuntimeError('Aborted')
+        docs = {key: dict(value) for key, value in self.store.docs.items()}
+        for operation, ref, data in self.operations:
+            if operation == 'create' and ref.key in docs:
+                raise RuntimeError('AlreadyExists')
+            if operation == 'update' and ref.key not in docs:
+                raise RuntimeError('NotFound')
+            if operation == 'delete':
+                docs.pop(ref.key, None)
+            elif operation == 'update':
+                for field, value in data.items():
+                    docs[ref.key][field] = docs[ref.key].get(field, 0) + value.value if hasattr(value, 'value') else value
+            else:
+                docs[ref.key] = dict(data)
+        self.store.docs = docs
+
+
+class FakeStore:
+    def __init__(self):
+        self.docs = {}
+        self.next_id = 0
+        self.commits = []
+        self.fail_commits = 0
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def get_all(self, refs):
+        return [FakeSnapshot(ref) for ref in refs if ref.key in self.docs]
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def items(self):
+        return {doc_id: data for (collection, doc_id), data in self.docs.items() if collection == 'inventory'}
+
+    def key_holder(self, name, category):
+        data = self.docs.get(('inventory_keys', Myapp.inventory_key_ref(name, category).id))
+        return data and data['item_id']
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = FakeStore()
+    monkeypatch.setattr(Myapp, 'db', store)
+    monkeypatch.setattr(Myapp, 'use_firebase', False)
+    monkeypatch.setattr(Myapp, 'inventory_mirror', Myapp.InventoryMirror())
+    store.docs[('categories', 'c1')] = {'name': 'Hardware', 'item_count': 0}
+    store.docs[('categories', 'c2')] = {'name': 'Tools', 'item_count': 0}
+    return store
+
+
+CATEGORIES = {'c1': 'Hardware', 'hardware': 'Hardware', 'c2': 'Tools', 'tools': 'Tools'}
+SUPPLIERS = {'acme': 'Acme'}
+
+
+def import_rows(store, rows):
+    writer = Myapp.BulkInventoryWriter({
+        'Hardware': store.collection('categories').document('c1'),
+        'Tools': store.collection('categories').document('c2')
+    })
+    writer.write_chunk([(number, Myapp.validate_bulk_row(row, CATEGORIES, SUPPLIERS)) for number, row in enumerate(rows, start=1)])
+    writer.flush()
+    return writer
+
+
+def item(name, category='Hardware', **fields):
+    return {'name': name, 'category': category, 'stock': 1, 'price': 1.0, 'supplier': 'acme', **fields}
+
+
+def test_duplicate_rows_in_one_file_update_the_first_item(store):
+    writer = import_rows(store, [item('Bolt', stock=10), item(' bolt ', 'hardware', stock=3)])
+
+    assert (writer.created, writer.updated, writer.errors) == (1, 1, [])
+    [(item_id, saved)] = store.items().items()
+    assert saved['stock'] == 3
+    assert store.key_holder('Bolt', 'Hardware') == item_id
+    assert store.docs[('categories', 'c1')]['item_count'] == 1
+
+
+def test_rename_onto_a_key_taken_earlier_in_the_file_is_rejected(store):
+    import_rows(store, [item('Bolt')])
+    bolt_id = store.key_holder('Bolt', 'Hardware')
+
+    writer = import_rows(store, [item('Nut'), {'id': bolt_id, 'name': 'Nut'}])
+
+    assert writer.created == 1
+    assert writer.errors == [{'row': 2, 'error': 'An item with this name and category already exists.'}]
+    assert store.items()[bolt_id]['name'] == 'Bolt'
+
+
+def test_rename_moves_the_key_reservation(store):
+    import_rows(store, [item('Bolt')])
+    bolt_id = store.key_holder('Bolt', 'Hardware')
+
+    writer = import_rows(store, [{'id': bolt_id, 'name': 'Hammer', 'category': 'Tools'}])
+
+    assert (writer.updated, writer.errors) == (1, [])
+    assert store.key_holder('Bolt', 'Hardware') is None
+    assert store.key_holder('Hammer', 'Tools') == bolt_id
+    assert store.items()[bolt_id]['category'] == 'Tools'
+    assert store.docs[('categories', 'c1')]['item_count'] == 0
+    assert store.docs[('categories', 'c2')]['item_count'] == 1
+
+    # The freed key can be taken by a new item in a later upload
+    writer = import_rows(store, [item('Bolt')])
+    assert writer.created == 1
+
+
+def test_row_after_a_failed_batch_is_resolved_again(store, monkeypatch):
+    # Room for one row per batch, so row 2 is resolved after row 1's batch commits
+    monkeypatch.setattr(Myapp, 'FIRESTORE_MAX_BATCH_WRITES', Myapp.BULK_ROW_MAX_WRITES + 2)
+    store.fail_commits = 1
+
+    writer = import_rows(store, [item('Bolt', stock=10), item('Bolt', stock=3), item('Nut')])
+
+    assert [error['row'] for error in writer.errors] == [1]
+    assert (writer.created, writer.updated) == (2, 0)
+    saved = {data['name']: data for data in store.items().values()}
+    assert sorted(saved) == ['Bolt', 'Nut']
+    assert saved['Bolt']['stock'] == 3
+    assert store.docs[('categories', 'c1')]['item_count'] == 2
+    assert Myapp.inventory_mirror.find_by_name('Bolt')['stock'] == 3
+
+
+def test_batches_stay_within_the_write_limit(store):
+    writer = import_rows(store, [item(f'Item {number}', 'Hardware' if number % 2 else 'Tools') for number in range(300)])
+
+    assert (writer.created, writer.errors) == (300, [])
+    assert len(store.commits) == 2
+    assert all(size <= Myapp.FIRESTORE_MAX_BATCH_WRITES for size in store.commits)
+    assert store.docs[('categories', 'c1')]['item_count'] + store.docs[('categories', 'c2')]['item_count'] == 300